@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# batch_reconciliation.py - Reconcile many salary periods at once in a process pool
+
+import io
+import os
+import time
+import contextlib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+from history_store import scan_source_files
+from salary_reconciliation_agent import (EnhancedReconciliation, MATCH_GROUPS, MATCH_STATUSES, MISSING_KEY,
+                                         STATE_DIR, STATUS_CODE_COLUMN, canonical_employee_keys, status_field)
+
+BATCH_OUTPUT_PREFIX = "Multi_Period_Reconciliation"
+MASTER_COLUMNS = ['Employee_Name', 'Branch', 'Department', 'Designation']
+
+# Per-process state, set once by the pool initializer
+_WORKER_RECONCILER = None
+_EMPLOYEE_MASTER = None
+
+
+def period_range(start, end):
+    """'YYYY-MM' periods from ``start`` to ``end`` inclusive"""
+    return [p.strftime('%Y-%m') for p in pd.period_range(start, end, freq='M')]
+
+
+def find_period_files(dirs, periods=None):
+    """
+    {period: {source: path}} for every recognised export under ``dirs``.
+    When a source has several files for a period (re-downloads), the most
+    recently modified one is used.
+    """
+    found = {}
+    for path, source, period in scan_source_files(dirs):
+        if periods and period not in periods:
+            continue
+        current = found.setdefault(period, {}).get(source)
+        if current is None or os.path.getmtime(path) > os.path.getmtime(current):
+            found[period][source] = path
+    return dict(sorted(found.items()))
+
+
+def load_employee_master(reconciler, salary_file):
+    """
+    Employee master keyed by normalized employee ID: name, branch, department
+    and designation category from one (normally the latest) salary sheet
+    """
+    salary_df = reconciler.read_file_smart(salary_file, 'salary')
+    if salary_df is None:
+        return None
+    salary_cols = reconciler.detect_file_columns(salary_df, 'salary')
+    if 'employee_id' not in salary_cols:
+        return None
+    reconciler.prepare_salary(salary_df, salary_cols)
+    reconciler.update_identity_index(salary_df, salary_cols)
+    names = salary_df[salary_cols['employee_name']] if 'employee_name' in salary_cols else pd.Series(pd.NA, index=salary_df.index)
+    master = pd.DataFrame({
+        'Employee_Name': names.to_numpy(dtype=object),
+        'Branch': salary_df['Branch'].to_numpy(dtype=object),
+        'Department': salary_df['Department'].to_numpy(dtype=object),
+        'Designation': salary_df['Designation_Category'].to_numpy(dtype=object)
+    }, index=canonical_employee_keys(salary_df[salary_cols['employee_id']])[0].to_numpy())
+    return master[(master.index != MISSING_KEY) & ~master.index.duplicated(keep='last')]
+
+
+def _init_worker(reconciler_options, employee_master):
+    """Pool initializer: one reconciler and the shared employee master per process"""
+    global _WORKER_RECONCILER, _EMPLOYEE_MASTER
+    _WORKER_RECONCILER = EnhancedReconciliation(**reconciler_options)
+    # Periods run concurrently: read the bank reference and identity indexes and
+    # the column role cache but never rewrite them
+    _WORKER_RECONCILER.column_role_cache_file = None
+    if _WORKER_RECONCILER.reference_index is not None:
+        _WORKER_RECONCILER.reference_index.path = None
+    if _WORKER_RECONCILER.identity_index is not None:
+        _WORKER_RECONCILER.identity_index.read_only = True
+    _EMPLOYEE_MASTER = employee_master
+
+
+def period_frame(reconciler, salary_df, period, employee_master=None):
+    """Compact per-employee result of one period, with master attributes where known"""
+    salary_cols = reconciler.detect_file_columns(salary_df, 'salary')
+    keys, _ = canonical_employee_keys(salary_df[salary_cols['employee_id']])
+    column_or = lambda role: (salary_df[salary_cols[role]].to_numpy() if role in salary_cols
+                              else np.full(len(salary_df), None, dtype=object))
+    frame = pd.DataFrame({
+        'Period': period,
+        'Employee_Key': keys.to_numpy(),
+        'Employee_ID': column_or('employee_id'),
+        'Employee_Name': column_or('employee_name'),
+        'Branch': salary_df['Branch'].to_numpy(dtype=object),
+        'Department': salary_df['Department'].to_numpy(dtype=object),
+        'Designation': salary_df['Designation_Category'].to_numpy(dtype=object),
+        'Basic_Salary': column_or('basic_salary'),
+        STATUS_CODE_COLUMN: salary_df[STATUS_CODE_COLUMN].to_numpy()
+    })
+    if 'Bank_Match_Window' in salary_df.columns:
+        frame['Bank_Match_Window'] = salary_df['Bank_Match_Window'].to_numpy()
+    for label, _ in MATCH_GROUPS.values():
+        for suffix in ('Paid_Amount', 'Variance', 'Variance_Bucket'):
+            col = f'{label}_{suffix}'
+            if col in salary_df.columns:
+                frame[col] = salary_df[col].to_numpy()
+
+    if employee_master is not None and not employee_master.empty:
+        # One view of each employee across months: current master values win
+        for col in MASTER_COLUMNS:
+            mapped = frame['Employee_Key'].map(employee_master[col])
+            frame[col] = mapped.where(mapped.notna(), frame[col])
+    return frame
+
+
+def _reconcile_period(period, files, settle_bank=False):
+    """
+    Worker task: reconcile one period with the process's reconciler. With
+    ``settle_bank`` it returns the matched salary frame, keyed inputs and
+    match matrix instead of the period frame, for settle_bank_periods.
+    """
+    started = time.time()
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            salary_df, discrepancies, matches = _WORKER_RECONCILER.reconcile_six_files(files, period)
+        if salary_df is None:
+            raise ValueError("salary data could not be processed")
+        if settle_bank:
+            employees = (salary_df, _WORKER_RECONCILER.source_inputs, _WORKER_RECONCILER.match_matrix)
+        else:
+            employees = period_frame(_WORKER_RECONCILER, salary_df, period, _EMPLOYEE_MASTER)
+        discrepancies.insert(0, 'Period', period)
+        return period, employees, discrepancies, matches, None, time.time() - started, _WORKER_RECONCILER.column_role_cache
+    except Exception as e:
+        return (period, None, None, {}, f"{e}\n{log.getvalue()[-2000:]}", time.time() - started,
+                _WORKER_RECONCILER.column_role_cache)
+
+
+def settle_bank_periods(reconciler, results, employee_master=None):
+    """
+    Redo each period's bank matching in period order against the reconciler's
+    carry-forward ledger, over the payments the workers keyed, so payments
+    from adjacent SOA windows and arrears settle as in a sequence of
+    single-month runs. ``results`` holds the workers' (matched, discrepancies,
+    matches, error) per period and is updated in place with period frames.
+    """
+    for period in sorted(results):
+        matched, discrepancies, matches, error = results[period]
+        if error:
+            continue
+        salary_df, inputs, match_matrix = matched
+        salary_cols = reconciler.detect_file_columns(salary_df, 'salary')
+        reconciler.run_period = period
+        reconciler.match_matrix = match_matrix
+        with contextlib.redirect_stdout(io.StringIO()):
+            salary_df, discrepancies, matches = reconciler.match_sources(salary_df, salary_cols, inputs, ['bank'])
+        discrepancies.insert(0, 'Period', period)
+        results[period] = (period_frame(reconciler, salary_df, period, employee_master), discrepancies, matches, None)
+        carried = salary_df['Bank_Match_Window'].isin(['Adjacent Window', 'Carried Forward']).sum() \
+            if 'Bank_Match_Window' in salary_df.columns else 0
+        if carried:
+            print(f"🔁 {period}: {carried} employees matched through other SOA windows or arrears")
+
+
+def reconcile_periods(period_files, workers=None, reconciler_options=None, master_file=None):
+    """
+    Reconcile every period of ``period_files`` ({period: files dict}) in a
+    process pool. The employee master is loaded once here (from
+    ``master_file`` or the latest period's salary sheet) and handed to each
+    worker by the pool initializer. With a carry-forward ledger (a
+    ``state_dir``) bank matching is then settled in period order here.
+
+    Returns (employee_periods, discrepancies, period_summary) frames.
+    """
+    # Periods share no incremental run state. The carry-forward ledger is only
+    # kept here: its items must be settled in period order, after the pool.
+    reconciler_options = dict(reconciler_options or {}, run_state_dir=None)
+    worker_options = dict(reconciler_options, carry_forward_file=None)
+    periods = [p for p, files in sorted(period_files.items()) if files.get('salary')]
+    skipped = sorted(set(period_files) - set(periods))
+    if skipped:
+        print(f"⚠️ No salary sheet for: {', '.join(skipped)}")
+    if not periods:
+        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+
+    master_file = master_file or period_files[periods[-1]]['salary']
+    reconciler = EnhancedReconciliation(**reconciler_options)
+    settle_bank = reconciler.carry_forward is not None
+    employee_master = load_employee_master(reconciler, master_file)
+    print(f"👥 Employee master: {0 if employee_master is None else len(employee_master)} employees "
+          f"from {os.path.basename(master_file)}")
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(periods)))
+    print(f"🚀 Reconciling {len(periods)} periods with {workers} process(es)...")
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(worker_options, employee_master)) as executor:
+        futures = [executor.submit(_reconcile_period, period, period_files[period], settle_bank) for period in periods]
+        for future in as_completed(futures):
+            period, employees, discrepancies, matches, error, seconds, roles = future.result()
+            results[period] = (employees, discrepancies, matches, error)
+            # Column roles the workers resolved are written once, here
+            reconciler.merge_column_roles(roles)
+            if error:
+                print(f"❌ {period}: {error.splitlines()[0]}")
+            else:
+                print(f"✅ {period}: reconciled ({seconds:.1f}s)")
+    if settle_bank:
+        settle_bank_periods(reconciler, results, employee_master)
+
+    summary_rows, employee_frames, discrepancy_frames = [], [], []
+    for period in periods:
+        employees, discrepancies, matches, error = results[period]
+        row = {'Period': period, 'Total_Employees': 0 if employees is None else len(employees)}
+        for group, (label, _) in MATCH_GROUPS.items():
+            row[f'{label}_Matches'] = matches.get(group, 0)
+        row['Discrepancies'] = 0 if discrepancies is None else len(discrepancies)
+        total = row['Total_Employees'] * len(MATCH_GROUPS)
+        row['Compliance_Score_%'] = round(sum(matches.values()) / total * 100, 2) if total else 0.0
+        row['Error'] = (error or '').split('\n', 1)[0]
+        summary_rows.append(row)
+        if employees is not None:
+            employee_frames.append(employees)
+            discrepancy_frames.append(discrepancies)
+
+    employee_periods = pd.concat(employee_frames, ignore_index=True) if employee_frames else pd.DataFrame()
+    discrepancies = pd.concat(discrepancy_frames, ignore_index=True) if discrepancy_frames else pd.DataFrame()
+    return employee_periods, discrepancies, pd.DataFrame(summary_rows)
+
+
+def employee_history(employee_periods):
+    """Per employee across the batch: periods present and matched periods per group"""
+    employee_periods = employee_periods[employee_periods['Employee_Key'] != MISSING_KEY]
+    if employee_periods.empty:
+        return pd.DataFrame()
+    employee_ids, keys = pd.factorize(employee_periods['Employee_Key'])
+    size = len(keys)
+    ordered = employee_periods.assign(_row=employee_ids).sort_values('Period')
+    latest = ordered.drop_duplicates('_row', keep='last').set_index('_row').sort_index()
+    first = ordered.drop_duplicates('_row', keep='first').set_index('_row').sort_index()
+    history = pd.DataFrame({
+        'Employee_ID': latest['Employee_ID'].to_numpy(),
+        'Employee_Name': latest['Employee_Name'].to_numpy(),
+        'Branch': latest['Branch'].to_numpy(),
+        'Department': latest['Department'].to_numpy(),
+        'Periods': np.bincount(employee_ids, minlength=size),
+        'First_Period': first['Period'].to_numpy(),
+        'Last_Period': latest['Period'].to_numpy()
+    })
+    status_codes = employee_periods[STATUS_CODE_COLUMN].to_numpy()
+    matched = MATCH_STATUSES.index('Matched')
+    for group, (label, _) in MATCH_GROUPS.items():
+        history[f'{label}_Matched_Periods'] = np.bincount(
+            employee_ids, weights=status_field(status_codes, group) == matched, minlength=size).astype('int64')
+    return history
+
+
+def write_batch_report(employee_periods, discrepancies, period_summary, output_prefix=BATCH_OUTPUT_PREFIX,
+                       reconciler=None):
+    """One workbook for the whole batch: period summary, employee history, all rows and discrepancies"""
+    reconciler = reconciler or EnhancedReconciliation(use_cache=False)
+    periods = period_summary['Period'].tolist() if not period_summary.empty else []
+    span = f"{periods[0]}_to_{periods[-1]}" if periods else datetime.now().strftime('%Y-%m')
+    output_file = f"{output_prefix}_{span}.xlsx"
+
+    paise_columns = ['Basic_Salary'] + [f'{label}_{suffix}' for label, _ in MATCH_GROUPS.values()
+                                        for suffix in ('Paid_Amount', 'Variance')]
+    with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
+        period_summary.to_excel(writer, sheet_name='Period_Summary', index=False)
+        if not employee_periods.empty:
+            employee_history(employee_periods).to_excel(writer, sheet_name='Employee_History', index=False)
+            reconciler.decode_match_status(reconciler.to_report_frame(employee_periods, paise_columns)).drop(
+                columns=['Employee_Key']).to_excel(writer, sheet_name='Employee_Periods', index=False)
+        if not discrepancies.empty:
+            reconciler.to_report_frame(discrepancies, ['Basic_Salary']).to_excel(
+                writer, sheet_name='Discrepancies_All_Periods', index=False)
+
+    print(f"📄 Multi-period report saved: {output_file}")
+    return output_file
+
+
+def run_batch(periods, dirs, workers=None, output_prefix=BATCH_OUTPUT_PREFIX, reconciler_options=None,
+              master_file=None):
+    """Find each period's exports under ``dirs``, reconcile them all and write the consolidated report"""
+    reconciler_options = dict({'state_dir': STATE_DIR}, **(reconciler_options or {}))
+    period_files = find_period_files(dirs, set(periods) if periods else None)
+    missing = sorted(set(periods or []) - set(period_files))
+    if missing:
+        print(f"⚠️ No exports found for: {', '.join(missing)}")
+    employee_periods, discrepancies, period_summary = reconcile_periods(
+        period_files, workers=workers, reconciler_options=reconciler_options, master_file=master_file)
+    if period_summary.empty:
+        print("❌ Nothing to reconcile")
+        return None, period_summary
+    return write_batch_report(employee_periods, discrepancies, period_summary, output_prefix), period_summary
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# history_store.py - Incremental ingestion of RMS downloads into a partitioned Parquet store
+
+import os
+import re
+import json
+from datetime import datetime
+import pandas as pd
+
+from parse_cache import file_digest, PARQUET_AVAILABLE
+
+HISTORY_DIR = os.getenv("HISTORY_DIR") or "history"
+INPUT_EXTENSIONS = ('.xls', '.xlsx', '.csv', '.txt')
+
+# File-name conventions of rms_downloader.py exports (and manual EPF/NPS uploads)
+_MONTH_YEAR = r'(?P<month>[A-Za-z]+)[_\- ](?P<year>\d{4})'
+_SOA_WINDOW = r'(?P<start>\d{2}-[A-Za-z]{3}-\d{4})_to_(?P<end>\d{2}-[A-Za-z]{3}-\d{4})'
+SOURCE_FILE_PATTERNS = [
+    ('salary', re.compile(r'^Salary_Sheet_' + _MONTH_YEAR, re.IGNORECASE)),
+    ('tds', re.compile(r'^TDS_(?:Report_)?' + _MONTH_YEAR, re.IGNORECASE)),
+    ('bank_kotak', re.compile(r'^SOA_Kotak\w*?_' + _SOA_WINDOW, re.IGNORECASE)),
+    ('bank_deutsche', re.compile(r'^SOA_Deutsche\w*?_' + _SOA_WINDOW, re.IGNORECASE)),
+    ('epf', re.compile(r'^(?:EPF|PF)(?:_Report)?_' + _MONTH_YEAR, re.IGNORECASE)),
+    ('nps', re.compile(r'^NPS(?:_Report)?_' + _MONTH_YEAR, re.IGNORECASE))
+]
+
+
+def _month_number(name):
+    for fmt in ('%B', '%b'):
+        try:
+            return datetime.strptime(name[:3] if fmt == '%b' else name, fmt).month
+        except ValueError:
+            continue
+    return None
+
+
+def classify_source_file(file_name):
+    """
+    Map an export file name to (source, 'YYYY-MM' salary period) or None.
+
+    Bank SOAs are named after their payment window, which covers the month
+    after the salary month (from the 1st), so the period is the month before
+    the window start.
+    """
+    base = os.path.basename(file_name)
+    for source, pattern in SOURCE_FILE_PATTERNS:
+        match = pattern.match(base)
+        if not match:
+            continue
+        if 'start' in match.groupdict():
+            start = datetime.strptime(match.group('start'), '%d-%b-%Y')
+            year, month = (start.year, start.month - 1) if start.month > 1 else (start.year - 1, 12)
+        else:
+            month = _month_number(match.group('month'))
+            year = int(match.group('year'))
+            if month is None:
+                return None
+        return source, f"{year:04d}-{month:02d}"
+    return None
+
+
+def scan_source_files(dirs, exclude=None):
+    """Yield (path, source, period) for every recognised export under ``dirs``"""
+    for folder in dirs:
+        if not folder or not os.path.isdir(folder):
+            continue
+        for dirpath, dirnames, filenames in os.walk(folder):
+            # Never descend into the excluded folder (e.g. the store itself)
+            if exclude and os.path.abspath(dirpath).startswith(os.path.abspath(exclude)):
+                dirnames[:] = []
+                continue
+            for name in sorted(filenames):
+                if name.startswith(('~$', '.')) or not name.lower().endswith(INPUT_EXTENSIONS):
+                    continue
+                classified = classify_source_file(name)
+                if classified:
+                    yield os.path.join(dirpath, name), classified[0], classified[1]
+
+
+class HistoryStore:
+    """
+    Partitioned Parquet history of every parsed source file.
+
+    Layout: ``<root>/source=<source>/period=<YYYY-MM>/<sha>.parquet`` plus a
+    ``manifest.json`` recording each ingested path with its mtime, size and
+    content hash, so only new or changed exports are ever parsed.
+
+    Each (source, period) holds one part: when a period has several exports
+    (timestamped re-downloads) the most recently modified one is stored and
+    the others stay in the manifest with ``part`` None.
+    """
+
+    def __init__(self, root=None, reconciler=None):
+        if not PARQUET_AVAILABLE:
+            raise RuntimeError("pyarrow is required for the history store")
+        self.root = root or HISTORY_DIR
+        os.makedirs(self.root, exist_ok=True)
+        self.manifest_path = os.path.join(self.root, 'manifest.json')
+        self.manifest = self._load_manifest()
+        if reconciler is None:
+            from salary_reconciliation_agent import EnhancedReconciliation
+            # Keep every column so history answers questions the monthly run never asked
+            reconciler = EnhancedReconciliation(project_columns=False)
+        self.reconciler = reconciler
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def partition_dir(self, source, period):
+        return os.path.join(self.root, f"source={source}", f"period={period}")
+
+    def current_part(self, source, period):
+        """(manifest key, entry) of the export stored for (source, period), or (None, None)"""
+        for key, entry in self.manifest.items():
+            if entry['source'] == source and entry['period'] == period and entry.get('part'):
+                return key, entry
+        return None, None
+
+    def scan(self, dirs):
+        """Yield (path, source, period) for every recognised export under ``dirs``"""
+        return scan_source_files(dirs, exclude=self.root)
+
+    def ingest(self, dirs):
+        """
+        Parse new or changed exports once and append them to the store.
+        Unchanged files are recognised by mtime/size without being read;
+        touched-but-identical files by content hash without being parsed.
+        """
+        counts = {'new': 0, 'changed': 0, 'unchanged': 0, 'duplicate': 0, 'superseded': 0, 'failed': 0}
+        known_hashes = {entry['sha256'] for entry in self.manifest.values() if entry.get('part')}
+
+        for path, source, period in self.scan(dirs):
+            key = os.path.abspath(path)
+            stat = os.stat(path)
+            entry = self.manifest.get(key)
+            if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                counts['unchanged'] += 1
+                continue
+
+            digest, _ = file_digest(path)
+            if entry and entry['sha256'] == digest:
+                entry.update({'mtime': stat.st_mtime, 'size': stat.st_size})
+                counts['unchanged'] += 1
+                continue
+            if digest in known_hashes:
+                # Same bytes already stored under another name (e.g. a timestamped re-download)
+                self.manifest[key] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha256': digest,
+                                      'source': source, 'period': period, 'part': None}
+                counts['duplicate'] += 1
+                continue
+
+            current_key, current = self.current_part(source, period)
+            if current is not None and current_key != key and current['mtime'] > stat.st_mtime:
+                # An older export of a period already held by a newer one
+                self.manifest[key] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha256': digest,
+                                      'source': source, 'period': period, 'part': None}
+                counts['superseded'] += 1
+                continue
+
+            part_dir = self.partition_dir(source, period)
+            part_path = os.path.join(part_dir, f"{digest[:16]}.parquet")
+            try:
+                df = self.reconciler.read_file_smart(path, source)
+                if df is None:
+                    counts['failed'] += 1
+                    continue
+                df = df.copy()
+                # Mixed int/str object columns (e.g. UAN with 'NA') can't be written as Parquet
+                for col in df.columns[df.dtypes == object]:
+                    df[col] = df[col].astype('string')
+                df['Source_File'] = os.path.basename(path)
+                os.makedirs(part_dir, exist_ok=True)
+                df.to_parquet(part_path, index=False)
+            except Exception as e:
+                print(f"⚠️ Could not ingest {os.path.basename(path)}: {e}")
+                counts['failed'] += 1
+                continue
+
+            # The new part replaces its own previous version and the period's older export
+            for old_entry in (entry, current):
+                if not old_entry or not old_entry.get('part'):
+                    continue
+                old_part = os.path.join(self.root, old_entry['part'])
+                if os.path.abspath(old_part) != os.path.abspath(part_path) and os.path.exists(old_part):
+                    os.remove(old_part)
+                old_entry['part'] = None
+            if current is not None and current_key != key:
+                counts['superseded'] += 1
+            counts['changed' if entry else 'new'] += 1
+
+            self.manifest[key] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha256': digest,
+                                  'source': source, 'period': period,
+                                  'part': os.path.relpath(part_path, self.root)}
+            known_hashes.add(digest)
+            print(f"📦 Ingested {source} {period}: {os.path.basename(path)} ({len(df)} rows)")
+
+        self._save_manifest()
+        return counts
+
+    def periods(self, source):
+        """Salary periods held for a source, oldest first"""
+        source_dir = os.path.join(self.root, f"source={source}")
+        if not os.path.isdir(source_dir):
+            return []
+        return sorted(name.split('=', 1)[1] for name in os.listdir(source_dir) if name.startswith('period='))
+
+    def query(self, source, periods=None, columns=None):
+        """Load a source's history for the given periods (all by default) with a Period column"""
+        # Only parts the manifest holds as current; leftovers of replaced exports are skipped
+        current = {os.path.normpath(entry['part']) for entry in self.manifest.values() if entry.get('part')}
+        frames = []
+        for period in periods or self.periods(source):
+            part_dir = self.partition_dir(source, period)
+            if not os.path.isdir(part_dir):
+                continue
+            for name in sorted(os.listdir(part_dir)):
+                if not name.endswith('.parquet'):
+                    continue
+                if os.path.relpath(os.path.join(part_dir, name), self.root) not in current:
+                    continue
+                df = pd.read_parquet(os.path.join(part_dir, name), columns=columns)
+                df['Period'] = period
+                frames.append(df)
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
@@ -22,6 +22,8 @@ rms_login, _imp_err_login = _safe_import("rms_login")
 rms_downloader, _imp_err_downloader = _safe_import("rms_downloader")
 salary_reconciliation_agent, _imp_err_reco = _safe_import("salary_reconciliation_agent")
 auto_email, _imp_err_mail = _safe_import("auto_email")
+history_store, _imp_err_history = _safe_import("history_store")
+batch_reconciliation, _imp_err_batch = _safe_import("batch_reconciliation")
 
 IST = ZoneInfo("Asia/Kolkata")
 
@@ -157,6 +159,47 @@ def action_email() -> None:
     else:
         logging.error("❌ auto_email module not available")
 
+def action_ingest(dirs: list[str] | None = None, store_dir: str | None = None) -> dict:
+    """Ingest new or changed RMS exports from DOWNLOAD_DIR and archive folders into the history store"""
+    if not history_store:
+        logging.error(f"❌ history_store module not available: {_imp_err_history}")
+        return {}
+
+    if not dirs:
+        download_dir = os.getenv("DOWNLOAD_DIR") or getattr(rms_downloader, "DOWNLOAD_DIR", None) or "."
+        archive_dirs = [d for d in (os.getenv("ARCHIVE_DIRS") or "").split(os.pathsep) if d]
+        dirs = [download_dir] + archive_dirs
+
+    logging.info(f"[INGEST] Scanning: {', '.join(dirs)}")
+    store = history_store.HistoryStore(root=store_dir)
+    counts = store.ingest(dirs)
+    logging.info(f"[INGEST] Done → {store.root}: {counts}")
+    return counts
+
+def action_batch(periods: list[str] | None = None, start: str | None = None, end: str | None = None,
+                 dirs: list[str] | None = None, workers: int | None = None) -> str:
+    """Reconcile several salary periods in a process pool into one consolidated report"""
+    if not batch_reconciliation:
+        logging.error(f"❌ batch_reconciliation module not available: {_imp_err_batch}")
+        return ""
+
+    if not periods:
+        if not end:
+            m, _, y = previous_month(now_ist().date())
+            end = f"{y:04d}-{m:02d}"
+        # Default window: the twelve salary months ending at ``end``
+        start = start or (datetime.strptime(end, "%Y-%m").date().replace(day=1) - timedelta(days=334)).strftime("%Y-%m")
+        periods = batch_reconciliation.period_range(start, end)
+    if not dirs:
+        download_dir = os.getenv("DOWNLOAD_DIR") or getattr(rms_downloader, "DOWNLOAD_DIR", None) or "."
+        dirs = [download_dir] + [d for d in (os.getenv("ARCHIVE_DIRS") or "").split(os.pathsep) if d]
+
+    logging.info(f"[BATCH] Periods {periods[0]} → {periods[-1]} ({len(periods)}) from: {', '.join(dirs)}")
+    output_file, period_summary = batch_reconciliation.run_batch(periods, dirs, workers=workers)
+    if output_file:
+        logging.info(f"[BATCH] Consolidated report: {output_file}")
+    return output_file or ""
+
 def action_all(month_name: str | None, year: int | None, skip_download: bool = False) -> None:
     """Run the complete workflow: download → reconcile → email"""
     logging.info(f"Starting complete workflow for {month_name or 'previous month'} {year or 'auto-detect year'}")
@@ -193,6 +236,15 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
     p_dl.add_argument("--year", type=int, help="Four-digit year, e.g., 2025")
     sub.add_parser("reconcile", help="Run reconciliation (salary_reconciliation_agent.py)")
     sub.add_parser("email", help="Send the final reconciliation email (auto_email.py)")
+    p_in = sub.add_parser("ingest", help="Append new/changed downloads to the columnar history store")
+    p_in.add_argument("--dirs", nargs="+", help="Folders to scan (default: DOWNLOAD_DIR plus ARCHIVE_DIRS)")
+    p_in.add_argument("--store", help="History store folder (default: HISTORY_DIR or ./history)")
+    p_b = sub.add_parser("batch", help="Reconcile many salary periods in parallel into one consolidated report")
+    p_b.add_argument("--periods", nargs="+", help="Salary periods as YYYY-MM, e.g., 2025-04 2025-05")
+    p_b.add_argument("--from", dest="start", help="First period YYYY-MM (default: twelve months before --to)")
+    p_b.add_argument("--to", dest="end", help="Last period YYYY-MM (default: previous month)")
+    p_b.add_argument("--dirs", nargs="+", help="Folders with the exports (default: DOWNLOAD_DIR plus ARCHIVE_DIRS)")
+    p_b.add_argument("--workers", type=int, help="Worker processes (default: one per CPU core)")
     p_all = sub.add_parser("all", help="Run download → reconcile → email")
     p_all.add_argument("--month-name", help="Month name, e.g., July")
     p_all.add_argument("--year", type=int, help="Four-digit year, e.g., 2025")
@@ -215,6 +267,11 @@ def main(argv: list[str]) -> int:
             action_reconcile()
         elif cmd == "email":
             action_email()
+        elif cmd == "ingest":
+            action_ingest(getattr(args, "dirs", None), getattr(args, "store", None))
+        elif cmd == "batch":
+            action_batch(getattr(args, "periods", None), getattr(args, "start", None), getattr(args, "end", None),
+                         getattr(args, "dirs", None), getattr(args, "workers", None))
         elif cmd == "all":
             month_name = getattr(args, "month_name", None)
             year = getattr(args, "year", None)
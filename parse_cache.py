@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# parse_cache.py - Content-addressed Parquet cache for parsed source files
+
+import os
+import hashlib
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (Parquet engine)
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+PARSE_CACHE_DIR = os.getenv("PARSE_CACHE_DIR") or ".parse_cache"
+PARSE_CACHE_MAX_MB = int(os.getenv("PARSE_CACHE_MAX_MB") or 512)
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_digest(file_path, head_size=0):
+    """
+    Hash a file's bytes in one pass.
+
+    Returns (sha256 hex digest, first ``head_size`` bytes) so callers can
+    sniff the format from the same read.
+    """
+    sha = hashlib.sha256()
+    head = b''
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            if len(head) < head_size:
+                head += chunk[:head_size - len(head)]
+            sha.update(chunk)
+    return sha.hexdigest(), head
+
+
+class ParseCache:
+    """
+    Disk cache of parsed DataFrames keyed by file content and parser version.
+
+    Entries are Parquet files named after the cache key. When the cache grows
+    past ``max_bytes`` the least recently used entries are removed.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or PARSE_CACHE_DIR
+        self.max_bytes = max_bytes if max_bytes is not None else PARSE_CACHE_MAX_MB * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, digest, parser_version, variant=''):
+        """Cache key for a file digest, parser version and output variant"""
+        return hashlib.sha256(f"{digest}|{parser_version}|{variant}".encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.parquet")
+
+    def get(self, key):
+        """Return the cached frame for ``key`` or None"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            df = pd.read_parquet(path)
+        except Exception as e:
+            print(f"⚠️ Discarding unreadable cache entry {path}: {e}")
+            self._remove(path)
+            self.misses += 1
+            return None
+        # Touch the entry so eviction is least-recently-used
+        os.utime(path, None)
+        self.hits += 1
+        return df
+
+    def put(self, key, df):
+        """Store ``df`` under ``key`` and evict old entries if over budget"""
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+            self.writes += 1
+        except Exception as e:
+            print(f"⚠️ Could not cache parsed frame: {e}")
+            self._remove(tmp_path)
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits ``max_bytes``"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.parquet'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if self._remove(path):
+                total -= size
+                self.evictions += 1
+        return total
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def clear(self):
+        """Remove every cached entry"""
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.parquet'):
+                self._remove(os.path.join(self.cache_dir, name))
+
+    def reset_stats(self):
+        """Zero the counters, e.g. at the start of a run"""
+        self.hits = self.misses = self.writes = self.evictions = 0
+
+    def stats(self):
+        """Hit/miss counters plus current on-disk size"""
+        entries = [n for n in os.listdir(self.cache_dir) if n.endswith('.parquet')]
+        size = sum(os.path.getsize(os.path.join(self.cache_dir, n)) for n in entries)
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate_%': round(self.hits / lookups * 100, 2) if lookups else 0.0,
+            'writes': self.writes,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'size_bytes': size
+        }
@@ -376,13 +376,15 @@ def export_bank_soa_for_bank(driver, from_str, to_str, bank_value, label_for_fil
 
 def export_bank_soa_for_salary_month(driver, salary_month_name, salary_year):
     """
-    Salary for <month/year> → payments happen next month (1st to 26th).
+    Salary for <month/year> → payments happen next month (normally 1st to 26th).
+    The export runs to month end so late payouts (27th onwards) are in the SOA;
+    the reconciliation attributes each payment to its period by date.
     Export for Kotak OD 0317 and Deutsche OD 100008.
     """
     base = datetime.strptime(f"01 {salary_month_name} {salary_year}", "%d %B %Y")
     pay_month = base + relativedelta(months=1)
     from_str = pay_month.replace(day=1).strftime("%d-%b-%Y")
-    to_str   = pay_month.replace(day=26).strftime("%d-%b-%Y")
+    to_str   = (pay_month + relativedelta(months=1, days=-1)).strftime("%d-%b-%Y")
     print(f"[bank] salary {salary_month_name} {salary_year} → payment window {from_str} to {to_str}")
 
     try:
@@ -3,11 +3,1162 @@ import os
 from datetime import datetime, timedelta
 import numpy as np
 import sys
-from pathlib import Path
 import glob
+import re
+import json
+import hashlib
+import sqlite3
+import threading
+from contextlib import closing
+from difflib import SequenceMatcher
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from lxml import etree
+from openpyxl import load_workbook
+from parse_cache import ParseCache, PARQUET_AVAILABLE, file_digest
+from history_store import classify_source_file
+
+# RMS "xls" exports are HTML; the salary grid is always rendered with this id
+RMS_GRID_TABLE_ID = 'cphMainContent_mainContent_GridView2'
+HEADER_SCAN_ROWS = 10
+SNIFF_BYTES = 8192
+# Bump whenever a parser's output changes so stale cache entries are ignored
+PARSER_VERSION = 10
+
+class SourceAdapter:
+    """
+    One input reconciled against the salary sheet.
+
+    ``name`` is its key in the files dict, ``group`` the match column it
+    feeds (several bank SOAs feed one Bank column) and ``kind`` the column
+    roles/schema used to read it. ``key`` is the column role holding the
+    employee ID. ``amount_role`` is summed per employee and, with
+    ``match_rule='amount'``, compared with the salary ``expected_role``.
+
+    ``loader(reconciler, file_path, file_type)`` parses the file into a
+    frame and ``key_extractor(reconciler, source, df, columns)`` turns that
+    frame into the source's named inputs: ``{'keyed': rows}`` of
+    Employee_Key/Amount, or ``{'payments': ..., 'transfers': ...}`` for the
+    bank payment stage. It returns None when the source can't be keyed.
+    """
+
+    def __init__(self, name, group, label, key='employee_id', amount_role=None, match_rule='presence',
+                 expected_role=None, kind=None, icon='📄', loader=None, key_extractor=None):
+        self.name = name
+        self.group = group
+        self.label = label
+        self.key = key
+        self.amount_role = amount_role
+        self.match_rule = match_rule
+        self.expected_role = expected_role
+        self.kind = kind or ('bank' if name.startswith('bank') else name)
+        self.icon = icon
+        self.loader = loader or read_source_file
+        self.key_extractor = key_extractor or employee_rows
+
+    def __repr__(self):
+        return f"SourceAdapter({self.name!r}, group={self.group!r})"
+
+
+def read_source_file(reconciler, file_path, file_type):
+    """Default loader: the reconciler's format-sniffing reader"""
+    return reconciler.read_file_smart(file_path, file_type)
+
+
+def employee_rows(reconciler, source, df, columns):
+    """Key extractor for statutory files: one Employee_Key/Amount row per record"""
+    rows = reconciler.source_keys(source, df, columns)
+    if rows is None:
+        print(f"⚠️ No employee ID, UAN, PRAN or PAN column found in {source.name} data")
+        return None
+    return {'keyed': rows}
+
+
+def bank_soa_payments(reconciler, source, df, columns):
+    """Key extractor for bank SOAs: salary payouts plus the bulk transfers they belong to"""
+    references = reconciler.parse_bank_references(df)
+    payments = reconciler.bank_payments(df, source.label, references)
+    print(f"   Found {len(payments)} records")
+    return {'payments': payments, 'transfers': reconciler.bulk_transfers(df, source.label, references)}
+
+
+# Match groups in report order: group -> (column label, Missing_From label).
+# Each group owns a field of the packed Match_Status_Code; the report decodes
+# it into a '<label>_Match_Status' column.
+MATCH_GROUPS = {
+    'bank': ('Bank', 'Bank SOA'),
+    'tds': ('TDS', 'TDS'),
+    'epf': ('EPF', 'EPF'),
+    'nps': ('NPS', 'NPS')
+}
+
+# Inputs of a monthly run besides the salary sheet. Another bank or statutory
+# file is one more entry here (plus its MATCH_GROUPS entry for a new group).
+RECONCILIATION_SOURCES = [
+    SourceAdapter('bank_kotak', 'bank', 'Kotak', key='employee', amount_role='amount', match_rule='amount',
+                  expected_role='net_pay', icon='🏦', key_extractor=bank_soa_payments),
+    SourceAdapter('bank_deutsche', 'bank', 'Deutsche', key='employee', amount_role='amount', match_rule='amount',
+                  expected_role='net_pay', icon='🏦', key_extractor=bank_soa_payments),
+    SourceAdapter('tds', 'tds', 'TDS', amount_role='tds_amount', match_rule='amount', expected_role='tds_deducted',
+                  icon='💰'),
+    SourceAdapter('epf', 'epf', 'EPF', amount_role='amount', icon='🏛️'),
+    SourceAdapter('nps', 'nps', 'NPS', amount_role='amount', icon='🏛️')
+]
+SOURCE_TYPES = ['salary'] + [source.name for source in RECONCILIATION_SOURCES]
+SOURCE_KINDS = {source.name: source.kind for source in RECONCILIATION_SOURCES}
+
+# 'pan' alone would also match e.g. 'Company'
+PAN_TERMS = ['pan no', 'panno', 'pan number', 'pan card', 'pancard', 'pan_no']
+
+# Column roles per source kind: each role takes the first column (in file
+# order) whose lower-cased name contains any of its terms.
+COLUMN_ROLE_TERMS = {
+    'salary': [
+        ('employee_id', ['empcode', 'employee id', 'emp_id', 'id']),
+        ('employee_name', ['employeename', 'employee name', 'name']),
+        ('location', ['baselocation', 'location', 'branch']),
+        ('designation', ['designation', 'role', 'position']),
+        ('department', ['department', 'dept']),
+        ('basic_salary', ['basic', 'salary', 'net']),
+        ('net_pay', ['clubnetpayable', 'netpayable', 'net payable', 'net pay']),
+        ('paid_date', ['paid date', 'paiddate', 'payment date']),
+        ('tds_deducted', ['tds']),
+        ('uan', ['uan']),
+        ('pran', ['pran']),
+        ('pan', PAN_TERMS),
+        ('bank_account', ['bankaccno', 'bank acc', 'account no', 'account number'])
+    ],
+    'bank': [
+        ('transaction_id', ['transactionid', 'transaction id', 'txn id']),
+        ('group_id', ['groupid', 'group id']),
+        ('narration', ['narration', 'description', 'particulars', 'remarks']),
+        ('employee', ['employee']),
+        ('amount', ['amount', 'salary', 'paid']),
+        ('date', ['date', 'value dt', 'txn dt']),
+        ('acc_head', ['acchead', 'account head']),
+        ('bank_name', ['bank']),
+        ('txn_type', ['type']),
+        ('currency', ['currency']),
+        ('bank_account', ['beneficiary account', 'bene account', 'account no', 'account number'])
+    ],
+    'epf': [
+        ('employee_id', ['employee', 'emp', 'id']),
+        ('amount', ['amount', 'contribution', 'deduction']),
+        ('uan', ['uan']),
+        ('pran', ['pran']),
+        ('pan', PAN_TERMS)
+    ],
+    'nps': [
+        ('employee_id', ['employee', 'emp', 'id']),
+        ('amount', ['amount', 'contribution', 'deduction']),
+        ('uan', ['uan']),
+        ('pran', ['pran']),
+        ('pan', PAN_TERMS)
+    ],
+    'tds': [
+        ('employee_id', ['employee', 'emp', 'id']),
+        ('tds_amount', ['tds', 'tax', 'deducted']),
+        ('pan', PAN_TERMS)
+    ]
+}
+
+# Rows kept per source kind: (column role, accepted values). Bank SOAs cover
+# every OD-account transaction; only salary payouts matter here.
+SOURCE_ROW_FILTERS = {
+    'bank': ('acc_head', ['Salary Exp-Payable'])
+}
+DEFAULT_CHUNK_ROWS = 50_000
+
+# What a reconciler keeps between runs (column roles, bank reference and
+# identity indexes, last run's state, carry-forward ledger) lives under one
+# state directory, by these names. Without a state directory it keeps nothing.
+STATE_DIR = os.getenv("RECONCILIATION_STATE_DIR") or ".reconciliation"
+COLUMN_ROLE_CACHE_FILE = "column_roles.json"
+
+# All money inside the engine is int64 paise; rupees only appear in reports
+PAISE_PER_RUPEE = 100
+# Amount cells that don't parse count as 0 and are reported. Their raw text
+# travels with the parsed (and cached) frame under this column prefix.
+UNPARSED_AMOUNT_PREFIX = '_unparsed:'
+UNPARSED_AMOUNT_COLUMNS = ['Source', 'Row', 'Column', 'Value']
+
+# Per-source match statuses, stored as categoricals
+MATCH_STATUSES = ['Pending', 'Matched', 'Not Found', 'Amount Mismatch']
+
+# Employee keys are int64 in every source; IDs that do not parse get MISSING_KEY
+MISSING_KEY = -1
+# Trailing employee number of a raw ID: '3220', '3220.0', '003220', 'Name-3220'
+EMPLOYEE_KEY_PATTERN = r'(?:^|[-\s])(\d{1,18})(?:\.0+)?$'
+UNPARSED_KEY_COLUMNS = ['Source', 'Row', 'Value']
+
+# Packed per-employee status: a 2-bit field per match group holding its
+# MATCH_STATUSES index, in the smallest unsigned type that fits every group
+STATUS_CODE_COLUMN = 'Match_Status_Code'
+STATUS_FIELD_BITS = 2
+STATUS_FIELD_MASK = (1 << STATUS_FIELD_BITS) - 1
+MATCH_GROUP_SHIFTS = {group: i * STATUS_FIELD_BITS for i, group in enumerate(MATCH_GROUPS)}
+STATUS_CODE_DTYPE = next(dtype for dtype in (np.uint8, np.uint16, np.uint32, np.uint64)
+                         if np.iinfo(dtype).bits >= len(MATCH_GROUPS) * STATUS_FIELD_BITS)
+
+# Amount-aware matching: expected salary amount vs the total a source shows per employee
+BANK_MATCH_MODES = ['amount', 'presence']
+AMOUNT_STATUSES = ['Exact', 'Within Tolerance', 'Short Paid', 'Over Paid', 'Missing']
+# Size bands (₹ upper bounds) of variances beyond the tolerance, for triage
+VARIANCE_BUCKET_LIMITS = [100, 1000, 10000]
+VARIANCE_BUCKETS = (AMOUNT_STATUSES[:2] + [f'Up to ₹{VARIANCE_BUCKET_LIMITS[0]:,}'] +
+                    [f'₹{low:,} - ₹{high:,}' for low, high in zip(VARIANCE_BUCKET_LIMITS, VARIANCE_BUCKET_LIMITS[1:])] +
+                    [f'Over ₹{VARIANCE_BUCKET_LIMITS[-1]:,}', 'Missing'])
+
+# Fallback matching of bank rows without an employee ID, by payee name (and amount)
+NAME_TITLES = {'MR', 'MRS', 'MS', 'DR', 'SHRI', 'SMT', 'KUM'}
+NAME_MATCH_THRESHOLD = 0.75
+NAME_BLOCK_MAX_POSTINGS = 200
+
+# SOA narration formats, tried in order over the whole column:
+#   Kotak uploads:   NEFT-2507080QAC2K- KOSPL2 KOTAKSINGLE2 0 20257899:Create By:...
+#   Kotak transfers: IFT-SHALINI RAGHUWANSHI-FCM-250708HIT5VT:Create By:...
+#   Deutsche:        NET/RTGS/Sakshi Gaba Dhawan/AXIS BANK:Create By:...
+NARRATION_PATTERNS = [
+    re.compile(r'^(?P<channel>NEFT|RTGS|IMPS|IFT)-(?P<utr>[A-Z0-9]{8,})-\s*'
+               r'(?P<batch_tag>[A-Z0-9]+\s+[A-Z0-9]+)\s+\d+\s+(?P<batch_id>\d+)', re.IGNORECASE),
+    re.compile(r'^(?P<channel>NEFT|RTGS|IMPS|IFT)-(?P<payee>[^-:]+?)-FCM-(?P<utr>[A-Z0-9]+)', re.IGNORECASE),
+    re.compile(r'^NET/(?P<channel>NEFT|RTGS|IMPS|IFT)/(?P<payee>[^/:]+)/(?P<payee_bank>[^/:]+)', re.IGNORECASE)
+]
+NARRATION_FIELDS = ['channel', 'utr', 'batch_tag', 'batch_id', 'payee', 'payee_bank']
+
+# Payment references (UTR -> employees) kept across months
+BANK_REFERENCE_INDEX_FILE = "bank_references.parquet"
+# Transaction IDs made up from the row position when an SOA has no ID column;
+# they repeat every month, so such payments are never indexed
+SYNTHETIC_TXN_PREFIX = 'ROW:'
+
+# Statutory and bank identifiers mapped to EmpCode, built from the salary
+# sheet and kept across months; other sources' rows resolve through it
+IDENTITY_INDEX_FILE = "employee_identity.db"
+IDENTITY_ROLES = ['uan', 'pran', 'pan', 'bank_account']
+IDENTITY_LABELS = {'uan': 'UAN', 'pran': 'PRAN', 'pan': 'PAN', 'bank_account': 'Bank Account'}
+# Shape of a real identifier once normalized; anything else ('NA', '-', '0',
+# 'PANNOTAVBL') is a placeholder and never indexed or looked up
+IDENTITY_PATTERNS = {
+    'uan': r'\d{12}',
+    'pran': r'\d{12}',
+    'pan': r'[A-Z]{5}\d{4}[A-Z]',
+    'bank_account': r'\d{9,18}'
+}
+
+# Last run's normalized inputs, so a rerun re-keys only the files that changed
+RUN_STATE_DIR = "last_run"
+RUN_STATE_VERSION = 4
+
+# Salary for a month is due in the next month by the 26th; payments after it
+# are 'Late' (rms_downloader.export_bank_soa_for_salary_month exports the SOA
+# to month end so they are there to find)
+BANK_WINDOW_END_DAY = 26
+BANK_MATCH_WINDOWS = ['Current', 'Late', 'Adjacent Window', 'Carried Forward', 'Not Paid']
+
+# Payments dated for another salary period and unpaid salary, rolled between runs
+CARRY_FORWARD_FILE = "carry_forward.parquet"
+
+BANK_REFERENCE_COLUMNS = ['Bank_Source', 'Transaction_ID', 'Parent_Transaction_ID', 'UTR', 'Channel',
+                          'Batch_ID', 'Date', 'Employee_Key', 'Amount']
+
+# How an employee's salary reached the bank, most severe first when several apply
+BANK_PAYMENT_PATTERNS = ['Duplicate', 'Multi-Bank', 'Split', 'Single', 'Not Paid']
+
+# (match group or column, flagged status, label used in Missing_From). Group
+# issues are read from the packed status code, column issues from the frame.
+DISCREPANCY_ISSUES = []
+for _group, (_label, _missing_label) in MATCH_GROUPS.items():
+    DISCREPANCY_ISSUES += [(_group, 'Not Found', _missing_label),
+                           (_group, 'Amount Mismatch', f'{_label} Amount')]
+DISCREPANCY_ISSUES.append(('Bank_Payment_Pattern', 'Duplicate', 'Bank Duplicate'))
+# (match group, Discrepancies_Detail column)
+DISCREPANCY_STATUS_COLUMNS = [(group, f'{label}_Status') for group, (label, _) in MATCH_GROUPS.items()]
+DISCREPANCY_COLUMNS = (['Employee_ID', 'Employee_Name', 'Branch', 'Department', 'Designation', 'Missing_From'] +
+                       [report_col for _, report_col in DISCREPANCY_STATUS_COLUMNS] + ['Basic_Salary'])
+
+# Declarative per-source schemas keyed by detection kind. Each lists the
+# detected column roles that hold money amounts (stored as int64 paise), dates
+# (with the explicit formats RMS and the banks use, tried in order), free text
+# and low-cardinality labels (stored as categoricals).
+SOURCE_SCHEMAS = {
+    'salary': {
+        'amounts': ['basic_salary', 'net_pay', 'tds_deducted'],
+        'dates': {'paid_date': ['%m/%d/%Y %I:%M:%S %p', '%m/%d/%Y']},
+        'text': ['employee_name'],
+        'categories': ['location', 'designation', 'department']
+    },
+    'bank': {
+        'amounts': ['amount'],
+        'dates': {'date': ['%d-%b-%y', '%d-%b-%Y', '%d/%m/%Y']},
+        'text': ['employee', 'narration'],
+        'categories': ['bank_name', 'txn_type', 'acc_head', 'currency']
+    },
+    'tds': {
+        'amounts': ['tds_amount'],
+        'dates': {},
+        'text': [],
+        'categories': []
+    },
+    'epf': {
+        'amounts': ['amount'],
+        'dates': {},
+        'text': [],
+        'categories': []
+    },
+    'nps': {
+        'amounts': ['amount'],
+        'dates': {},
+        'text': [],
+        'categories': []
+    }
+}
+
+# Text columns are Arrow-backed when pyarrow is installed
+TEXT_DTYPE = pd.StringDtype('pyarrow') if PARQUET_AVAILABLE else pd.StringDtype()
+
+# One row per salary payout found in a bank SOA
+BANK_PAYMENT_DTYPES = {
+    'Employee_Key': 'int64', 'Payee_Name': TEXT_DTYPE, 'Amount': 'int64', 'Bank_Source': TEXT_DTYPE,
+    'Transaction_ID': TEXT_DTYPE, 'Parent_Transaction_ID': TEXT_DTYPE, 'Date': 'datetime64[ns]',
+    'UTR': TEXT_DTYPE, 'Channel': TEXT_DTYPE, 'Batch_ID': TEXT_DTYPE
+}
+# One row per carry-forward ledger item
+CARRY_FORWARD_DTYPES = {
+    'Kind': TEXT_DTYPE, 'Period': TEXT_DTYPE, 'Employee_Key': 'int64', 'Amount': 'int64', 'Source': TEXT_DTYPE,
+    'Bank_Source': TEXT_DTYPE, 'Transaction_ID': TEXT_DTYPE, 'Date': 'datetime64[ns]', 'Recorded_In': TEXT_DTYPE,
+    'Resolved_In': TEXT_DTYPE
+}
+
+
+def source_kind(file_type):
+    """Column-detection kind for a source key (both bank SOAs are 'bank')"""
+    if file_type in SOURCE_KINDS:
+        return SOURCE_KINDS[file_type]
+    return 'bank' if file_type.startswith('bank') else file_type
+
+
+def build_match_matrix(salary_keys, keyed_sources):
+    """
+    Employee x source presence matrix in one pass over the key space: every
+    source's keys are concatenated, located in the salary key index at once
+    and scattered into a boolean matrix (column j = keyed_sources[j]).
+    """
+    salary_keys = np.asarray(salary_keys, dtype='int64')
+    # Rows without a key never match: give each its own negative placeholder
+    missing = salary_keys == MISSING_KEY
+    key_index = pd.Index(np.where(missing, -1 - np.cumsum(missing), salary_keys))
+    matrix = np.zeros((len(key_index), len(keyed_sources)), dtype=bool)
+    if not keyed_sources:
+        return matrix
+    all_keys = pd.Series(np.concatenate([np.asarray(keys, dtype='int64') for keys in keyed_sources]))
+    source_pos = np.repeat(np.arange(len(keyed_sources)), [len(keys) for keys in keyed_sources])
+    if key_index.is_unique:
+        rows = key_index.get_indexer(all_keys)
+        found = rows >= 0
+        matrix[rows[found], source_pos[found]] = True
+    else:
+        # Duplicate salary keys: mark every row holding the key
+        for j in range(len(keyed_sources)):
+            matrix[:, j] = key_index.isin(all_keys[source_pos == j].unique())
+    return matrix
+
+
+def _load_source_worker(reconciler, loader, file_type, file_path):
+    """Process-pool entry point: parse one source and return it with its load log and column roles"""
+    # Only the parent process writes the column role cache
+    reconciler.column_role_cache_file = None
+    df = loader(reconciler, file_path, file_type)
+    return df, reconciler.load_log.get(file_type), reconciler.column_role_cache
+
+
+def _is_text_cell(value):
+    """True for cells that look like header text rather than data"""
+    if not isinstance(value, str):
+        return False
+    value = value.strip()
+    if len(value) <= 2:
+        return False
+    try:
+        float(value.replace(',', ''))
+        return False
+    except ValueError:
+        return True
+
+
+def _coerce_column(column):
+    """Return the column as numbers when every present value parses as one"""
+    present = column.notna()
+    if not present.any():
+        return column
+    numeric = pd.to_numeric(column.astype(str).str.replace(',', '', regex=False), errors='coerce')
+    if numeric[present].notna().all():
+        return numeric
+    return column
+
+
+def _looks_like_header(row):
+    """A header row is mostly text and has at least two labels (not a title)"""
+    text_count = sum(1 for cell in row if _is_text_cell(cell))
+    return text_count >= 2 and text_count > len(row) * 0.5
+
+
+def parse_amounts(series):
+    """
+    Vectorized money parsing to int64 paise: '3,718.00' -> 371800.
+    Returns (paise, unparsed): blank and unparseable amounts become 0, and
+    ``unparsed`` flags the non-blank ones.
+    """
+    if pd.api.types.is_integer_dtype(series) or pd.api.types.is_float_dtype(series):
+        return rupees_to_paise(series.astype('float64')), np.zeros(len(series), dtype=bool)
+    text = series.astype('string').str.replace(r'[,\s₹]', '', regex=True)
+    rupees = pd.to_numeric(text, errors='coerce')
+    unparsed = (text.fillna('') != '').to_numpy() & rupees.isna().to_numpy()
+    return rupees_to_paise(rupees.astype('float64')), unparsed
+
+
+def rupees_to_paise(value):
+    """Rupees (scalar or Series) -> int64 paise, rounded to the nearest paisa"""
+    if isinstance(value, pd.Series):
+        return np.round(value.astype('float64').fillna(0) * PAISE_PER_RUPEE).astype('int64')
+    return int(round(float(value or 0) * PAISE_PER_RUPEE))
+
+
+def paise_to_rupees(value):
+    """int64 paise (scalar or Series) -> rupees; only used at the report boundary"""
+    return value / PAISE_PER_RUPEE
+
+
+def within_tolerance(paise_a, paise_b, tolerance_paise):
+    """Exact integer tolerance check on paise arrays"""
+    return np.abs(np.asarray(paise_a, dtype='int64') - np.asarray(paise_b, dtype='int64')) <= tolerance_paise
+
+
+def parse_dates(series, formats):
+    """Vectorized date parsing trying each explicit format in turn (no inference)"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    text = series.astype('string').str.strip()
+    result = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    for fmt in formats:
+        missing = result.isna() & text.notna()
+        if not missing.any():
+            break
+        result[missing] = pd.to_datetime(text[missing], format=fmt, errors='coerce')
+    return result
+
+
+def normalize_keys(series):
+    """Reference keys (transaction/group IDs) as comparable strings: trimmed, upper-case, no float '.0' tail"""
+    keys = series.astype('string').str.strip().str.upper()
+    return keys.str.replace(r'\.0+$', '', regex=True)
+
+
+def canonical_employee_keys(values):
+    """
+    Raw employee IDs (numbers, numeric text or a trailing '-ID') -> int64
+    keys. Returns (keys, unparsed): blanks and IDs without a trailing
+    employee number get MISSING_KEY, and ``unparsed`` flags the non-blank ones.
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_bool_dtype(values.dtype):
+        values = values.astype(object)
+    if pd.api.types.is_integer_dtype(values.dtype):
+        keys = values.astype('Int64').fillna(MISSING_KEY).astype('int64')
+        return keys, np.zeros(len(values), dtype=bool)
+    if pd.api.types.is_float_dtype(values.dtype):
+        whole = (values.notna() & (values % 1 == 0) & (values >= 0)).to_numpy()
+        keys = pd.Series(np.where(whole, values.fillna(0), MISSING_KEY).astype('int64'), index=values.index)
+        return keys, values.notna().to_numpy() & ~whole
+    text = values.astype('string').str.strip()
+    digits = text.str.extract(EMPLOYEE_KEY_PATTERN, expand=False)
+    keys = digits.astype('Int64').fillna(MISSING_KEY).astype('int64')
+    unparsed = (text.fillna('') != '').to_numpy() & digits.isna().to_numpy()
+    return keys, unparsed
+
+
+def normalize_identifiers(values, id_type=None):
+    """
+    UAN/PRAN/PAN/bank account values as comparable text: upper-case
+    alphanumerics without Excel's '.0' tail or leading zeros. Blanks, and
+    with ``id_type`` values not shaped like its IDENTITY_PATTERNS, are NA.
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_float_dtype(values.dtype):
+        # Numeric exports: integral values without going through '1e+11'
+        values = values.round().astype('Int64')
+    text = values.astype('string').str.strip().str.upper().str.replace(r'\.0+$', '', regex=True)
+    text = text.str.replace(r'[^0-9A-Z]+', '', regex=True).str.lstrip('0')
+    valid = text != ''
+    if id_type in IDENTITY_PATTERNS:
+        valid &= text.str.fullmatch(IDENTITY_PATTERNS[id_type])
+    return text.where(valid.fillna(False))
+
+
+def status_field(codes, group):
+    """A group's MATCH_STATUSES index out of packed status codes"""
+    return (np.asarray(codes) >> MATCH_GROUP_SHIFTS[group]) & STATUS_FIELD_MASK
+
+
+def pack_status_field(codes, group, field):
+    """Packed status codes with ``group``'s field replaced by ``field``"""
+    shift = STATUS_CODE_DTYPE(MATCH_GROUP_SHIFTS[group])
+    cleared = codes & ~(STATUS_CODE_DTYPE(STATUS_FIELD_MASK) << shift)
+    return cleared | (np.asarray(field).astype(STATUS_CODE_DTYPE) << shift)
+
+
+def status_labels(field, index=None):
+    """Categorical status column from a group's status field"""
+    return pd.Series(pd.Categorical.from_codes(np.asarray(field, dtype='int8'), MATCH_STATUSES), index=index)
+
+
+def split_employee_field(values):
+    """
+    Bank 'Name-ID' values -> (int64 key, name, unparsed). Values without
+    '-ID', or whose ID does not parse, keep the whole value as name.
+    """
+    values = values.astype('string').str.strip()
+    has_id = values.str.contains('-', regex=False).fillna(False)
+    parts = values.str.rsplit('-', n=1)
+    keys, unparsed = canonical_employee_keys(parts.str[-1].where(has_id))
+    names = parts.str[0].str.strip().where(has_id & ~unparsed, values).fillna('')
+    return keys, names, unparsed
+
+
+def join_per_employee(frame, column):
+    """
+    ``column`` values joined with ', ' per Employee_Key of a frame sorted by
+    it, as one reduceat over the whole column rather than a join per group
+    """
+    keys = frame['Employee_Key'].to_numpy()
+    if not len(keys):
+        return pd.Series([], dtype=object)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    values = frame[column].to_numpy(dtype=object)
+    later = np.ones(len(values), dtype=bool)
+    later[starts] = False
+    values[later] = ', ' + values[later]
+    return pd.Series(np.add.reduceat(values, starts), index=keys[starts])
+
+
+def name_tokens(series):
+    """Normalized name tokens per value: upper-case letters only, titles dropped"""
+    words = series.astype('string').fillna('').str.upper().str.replace(r'[^A-Z]+', ' ', regex=True).str.split()
+    return words.map(lambda tokens: [t for t in tokens if t not in NAME_TITLES])
+
+
+def parse_narrations(series):
+    """
+    Channel/UTR/batch/payee fields from bank narrations, one compiled pattern
+    at a time over every row not yet parsed. Unrecognised rows stay <NA>.
+    """
+    text = series.astype('string').str.strip()
+    parsed = pd.DataFrame({field: pd.Series(pd.NA, index=series.index, dtype=TEXT_DTYPE) for field in NARRATION_FIELDS})
+    pending = text.notna().to_numpy(dtype=bool).copy()
+    for pattern in NARRATION_PATTERNS:
+        if not pending.any():
+            break
+        found = text[pending].str.extract(pattern)
+        hit = found.notna().any(axis=1)
+        for field in found.columns:
+            parsed.loc[found.index[hit], field] = found.loc[hit, field].str.strip()
+        pending[series.index.get_indexer(found.index[hit])] = False
+    parsed['channel'] = parsed['channel'].str.upper()
+    parsed['utr'] = parsed['utr'].str.upper()
+    return parsed
+
+
+class BankReferenceIndex:
+    """
+    Persistent index of salary payouts with a UTR: which employees (and
+    amounts) each bank transfer carried, one row per (Bank_Source,
+    Transaction_ID), kept in one Parquet file so references resolve across
+    months. Bulk transfers are explained through it by their transaction ID
+    (children's Parent_Transaction_ID) or, without a GroupId link, by UTR.
+    """
+
+    def __init__(self, path=BANK_REFERENCE_INDEX_FILE):
+        self.path = path
+        try:
+            self.frame = pd.read_parquet(path) if path and os.path.exists(path) else None
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable bank reference index {path}: {e}")
+            self.frame = None
+        if self.frame is None:
+            self.frame = pd.DataFrame({col: pd.Series([], dtype=BANK_PAYMENT_DTYPES.get(col, 'int64'))
+                                       for col in BANK_REFERENCE_COLUMNS})
+        elif not pd.api.types.is_integer_dtype(self.frame['Employee_Key'].dtype):
+            self.frame['Employee_Key'] = canonical_employee_keys(self.frame['Employee_Key'])[0]
+
+    def upsert(self, payments):
+        """Add or replace the referenced payments of a run and save"""
+        synthetic = payments['Transaction_ID'].str.startswith(SYNTHETIC_TXN_PREFIX).fillna(True)
+        rows = payments[payments['UTR'].notna() & (payments['Employee_Key'] != MISSING_KEY) & ~synthetic]
+        rows = rows[BANK_REFERENCE_COLUMNS]
+        if rows.empty:
+            return 0
+        merged = pd.concat([self.frame, rows], ignore_index=True)
+        self.frame = merged.drop_duplicates(['Bank_Source', 'Transaction_ID'], keep='last').reset_index(drop=True)
+        if self.path:
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                self.frame.to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print(f"⚠️ Could not save bank reference index: {e}")
+        return len(rows)
+
+    def lookup(self, utrs):
+        """Payments carried by any of the given UTRs"""
+        wanted = pd.Series(list(utrs), dtype=TEXT_DTYPE).str.upper()
+        return self.frame[self.frame['UTR'].isin(wanted)]
+
+    def children(self, bank_source, parent_ids):
+        """Payments recorded under the given bulk-transfer transaction IDs"""
+        frame = self.frame
+        return frame[(frame['Bank_Source'] == bank_source) & frame['Parent_Transaction_ID'].isin(list(parent_ids))]
+
+
+class ReconciliationState:
+    """
+    The last run's normalized inputs on disk: the prepared salary frame, each
+    source's keyed rows (bank SOAs as payments and bulk transfers), the match
+    matrix and the content hash of every input file. ``state.json`` is
+    written last and marks the frames as one consistent run.
+    """
+
+    def __init__(self, root=RUN_STATE_DIR):
+        self.root = root
+        self.meta_path = os.path.join(root, 'state.json')
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                self.meta = json.load(f)
+        except (OSError, ValueError):
+            self.meta = None
+
+    def usable(self, settings, salary_digest):
+        """Whether the saved run used these settings and this salary file"""
+        return (self.meta is not None and self.meta.get('settings') == settings
+                and self.meta['digests'].get('salary') == salary_digest)
+
+    def frame(self, name):
+        return pd.read_parquet(os.path.join(self.root, f"{name}.parquet"))
+
+    def save(self, meta, frames):
+        """Replace the saved run with ``frames`` and ``meta``"""
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            if os.path.exists(self.meta_path):
+                os.remove(self.meta_path)
+            for name in os.listdir(self.root):
+                if name.endswith('.parquet') and name[:-len('.parquet')] not in frames:
+                    os.remove(os.path.join(self.root, name))
+            for name, df in frames.items():
+                path = os.path.join(self.root, f"{name}.parquet")
+                df.to_parquet(f"{path}.tmp", index=False)
+                os.replace(f"{path}.tmp", path)
+            with open(f"{self.meta_path}.tmp", 'w', encoding='utf-8') as f:
+                json.dump(meta, f, indent=1)
+            os.replace(f"{self.meta_path}.tmp", self.meta_path)
+            self.meta = meta
+        except Exception as e:
+            print(f"⚠️ Could not save reconciliation state: {e}")
+            self.meta = None
+
+
+class CarryForwardLedger:
+    """
+    Cross-window ledger in one Parquet file, one row per item:
+
+    - 'Payment': a bank payment whose date belongs to another salary period
+      than the run that saw it; that period's run picks it up without
+      rescanning the statement.
+    - 'Open Item': salary still owed for a period (not found or short paid);
+      a later period's surplus payment to the employee settles it.
+
+    ``Recorded_In``/``Resolved_In`` name the runs that wrote and consumed an
+    item, so re-running a period first undoes what it did before. An item a
+    later run already consumed stays consumed when the re-run records it again.
+    """
+
+    # What identifies an item across re-runs of the period that recorded it
+    ITEM_KEY = ['Kind', 'Period', 'Employee_Key', 'Bank_Source', 'Transaction_ID']
+
+    def __init__(self, path=CARRY_FORWARD_FILE):
+        self.path = path
+        try:
+            self.frame = pd.read_parquet(path) if path and os.path.exists(path) else None
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable carry-forward ledger {path}: {e}")
+            self.frame = None
+        if self.frame is None:
+            self.frame = pd.DataFrame({col: pd.Series([], dtype=dtype) for col, dtype in CARRY_FORWARD_DTYPES.items()})
+        elif not pd.api.types.is_integer_dtype(self.frame['Employee_Key'].dtype):
+            self.frame['Employee_Key'] = canonical_employee_keys(self.frame['Employee_Key'])[0]
+        # Later runs' resolutions of the items the current re-run dropped, by item key
+        self.carried_resolutions = {}
+
+    def item_keys(self, frame):
+        return pd.MultiIndex.from_frame(frame[self.ITEM_KEY].astype(object).where(frame[self.ITEM_KEY].notna(), ''))
+
+    def reset_run(self, period):
+        """Forget what an earlier run of ``period`` recorded or consumed"""
+        recorded = (self.frame['Recorded_In'] == period).to_numpy()
+        settled = self.frame[recorded & self.frame['Resolved_In'].notna().to_numpy()]
+        self.carried_resolutions = dict(zip(self.item_keys(settled), settled['Resolved_In']))
+        frame = self.frame[~recorded].reset_index(drop=True)
+        frame.loc[frame['Resolved_In'] == period, 'Resolved_In'] = pd.NA
+        self.frame = frame
+
+    def add(self, rows):
+        rows = rows.reindex(columns=list(CARRY_FORWARD_DTYPES)).astype(CARRY_FORWARD_DTYPES)
+        if self.carried_resolutions and not rows.empty:
+            # Re-recorded items a later period already settled stay settled
+            resolved_in = self.item_keys(rows).map(lambda key: self.carried_resolutions.get(key, pd.NA))
+            rows['Resolved_In'] = rows['Resolved_In'].fillna(pd.Series(resolved_in, index=rows.index, dtype=TEXT_DTYPE))
+        self.frame = pd.concat([self.frame, rows], ignore_index=True)
+
+    def pending(self, kind, period, before=False):
+        """Unresolved items of ``kind`` for ``period`` (or every earlier period)"""
+        frame = self.frame
+        periods = frame['Period'] < period if before else frame['Period'] == period
+        return frame[(frame['Kind'] == kind) & periods & frame['Resolved_In'].isna() &
+                     (frame['Recorded_In'] != period)]
+
+    def resolve(self, index, period):
+        self.frame.loc[index, 'Resolved_In'] = period
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            self.frame.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"⚠️ Could not save carry-forward ledger: {e}")
+
+
+class EmployeeIdentityIndex:
+    """
+    Persistent identifier -> employee table in SQLite, one row per
+    (ID_Type, ID_Value) with the EmpCode key it belongs to. The primary key
+    serves bulk lookups; a second index serves per-employee queries.
+    """
+
+    def __init__(self, path=IDENTITY_INDEX_FILE):
+        self.path = path
+        # Batch workers read the index but leave updates to the main process
+        self.read_only = False
+        try:
+            with closing(sqlite3.connect(path)) as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS employee_identifiers (
+                        id_type TEXT NOT NULL,
+                        id_value TEXT NOT NULL,
+                        employee_key INTEGER NOT NULL,
+                        first_period TEXT,
+                        last_period TEXT,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (id_type, id_value)
+                    ) WITHOUT ROWID
+                ''')
+                conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_employee_identifiers_employee
+                    ON employee_identifiers (employee_key, id_type)
+                ''')
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ Employee identity index unavailable ({path}): {e}")
+            self.path = None
+
+    def update(self, employee_keys, identifiers, period=None):
+        """
+        Upsert ``{id_type: values}`` aligned with ``employee_keys``. An
+        identifier seen under another employee moves to the new one; one the
+        sheet gives to several employees is ambiguous and is dropped from the
+        index. Returns (rows written, identifiers reassigned).
+        """
+        if not self.path or self.read_only:
+            return 0, 0
+        keys = np.asarray(employee_keys, dtype='int64')
+        rows = pd.concat([pd.DataFrame({'id_type': id_type,
+                                        'id_value': normalize_identifiers(values, id_type).to_numpy(),
+                                        'employee_key': keys})
+                          for id_type, values in identifiers.items()], ignore_index=True)
+        rows = rows[rows['id_value'].notna() & (rows['employee_key'] != MISSING_KEY)]
+        rows = rows.drop_duplicates(['id_type', 'id_value', 'employee_key'])
+        shared = rows.duplicated(['id_type', 'id_value'], keep=False).to_numpy()
+        if shared.any():
+            ambiguous = rows[shared].drop_duplicates(['id_type', 'id_value'])
+            self.forget(ambiguous['id_type'], ambiguous['id_value'])
+            print(f"⚠️ {len(ambiguous)} identifiers shared by several employees were not indexed")
+            rows = rows[~shared]
+        if rows.empty:
+            return 0, 0
+        moved = 0
+        for id_type, group in rows.groupby('id_type', sort=False):
+            known = self.lookup(id_type, group['id_value'])
+            group = group[group['id_value'].isin(known.index)]
+            moved += int((known.reindex(group['id_value']).to_numpy() != group['employee_key'].to_numpy()).sum())
+        records = [(id_type, value, int(key), period, period)
+                   for id_type, value, key in rows[['id_type', 'id_value', 'employee_key']].itertuples(index=False)]
+        try:
+            with closing(sqlite3.connect(self.path)) as conn:
+                conn.executemany('''
+                    INSERT INTO employee_identifiers (id_type, id_value, employee_key, first_period, last_period)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (id_type, id_value) DO UPDATE SET
+                        employee_key = excluded.employee_key,
+                        last_period = COALESCE(excluded.last_period, last_period),
+                        updated_at = CURRENT_TIMESTAMP
+                ''', records)
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ Could not update employee identity index: {e}")
+            return 0, 0
+        return len(records), moved
+
+    def forget(self, id_types, id_values):
+        """Remove identifiers from the index"""
+        try:
+            with closing(sqlite3.connect(self.path)) as conn:
+                conn.executemany('DELETE FROM employee_identifiers WHERE id_type = ? AND id_value = ?',
+                                 zip(id_types, id_values))
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ Could not update employee identity index: {e}")
+    
+    def lookup(self, id_type, values):
+        """
+        Employee keys of already-normalized identifier values, as a Series
+        indexed by value (unknown values are absent). One indexed join per call.
+        """
+        wanted = pd.unique(pd.Series(values).dropna().astype(str))
+        if not self.path or len(wanted) == 0:
+            return pd.Series([], dtype='int64')
+        try:
+            with closing(sqlite3.connect(self.path)) as conn:
+                conn.execute('CREATE TEMP TABLE wanted (id_value TEXT PRIMARY KEY)')
+                conn.executemany('INSERT OR IGNORE INTO wanted VALUES (?)', ((value,) for value in wanted))
+                found = conn.execute('''
+                    SELECT e.id_value, e.employee_key FROM wanted w
+                    JOIN employee_identifiers e ON e.id_type = ? AND e.id_value = w.id_value
+                ''', (id_type,)).fetchall()
+        except sqlite3.Error as e:
+            print(f"⚠️ Employee identity lookup failed: {e}")
+            return pd.Series([], dtype='int64')
+        return pd.Series([key for _, key in found], index=[value for value, _ in found], dtype='int64')
+
+    def resolve(self, id_type, values):
+        """Raw identifier values -> int64 employee keys (MISSING_KEY where unknown)"""
+        normalized = normalize_identifiers(values, id_type)
+        known = self.lookup(id_type, normalized)
+        keys = np.full(len(normalized), MISSING_KEY, dtype='int64')
+        found = normalized.isin(known.index).to_numpy()
+        keys[found] = known.reindex(normalized[found]).to_numpy()
+        return keys
+
+    def counts(self):
+        """Identifiers held per type"""
+        if not self.path:
+            return {}
+        try:
+            with closing(sqlite3.connect(self.path)) as conn:
+                return dict(conn.execute('SELECT id_type, COUNT(*) FROM employee_identifiers GROUP BY id_type'))
+        except sqlite3.Error:
+            return {}
+
+
+class NameBlockIndex:
+    """
+    Blocking index over salary employee names for the bank fallback matcher.
+
+    Every name token of three or more letters is a block. A payee is only
+    compared with employees sharing one of its blocks, so the cost follows
+    block sizes instead of payees x employees. Tokens shared by more than
+    ``max_postings`` employees are too common to block on.
+    """
+
+    def __init__(self, keys, names, net_pay=None, max_postings=NAME_BLOCK_MAX_POSTINGS):
+        self.keys = np.asarray(keys, dtype='int64')
+        tokens = name_tokens(pd.Series(np.asarray(names, dtype=object)))
+        self.sorted_names = np.array([' '.join(sorted(t)) for t in tokens], dtype=object)
+        self.net_pay = None if net_pay is None else np.asarray(net_pay, dtype='int64')
+        
+        postings = pd.DataFrame({'pos': np.arange(len(tokens)), 'token': tokens.to_numpy()}).explode('token')
+        postings = postings[postings['token'].str.len() >= 3]
+        blocks = postings.groupby('token')['pos'].unique()
+        self.blocks = {token: positions for token, positions in blocks.items() if len(positions) <= max_postings}
+
+    def candidates(self, tokens):
+        found = [self.blocks[t] for t in tokens if t in self.blocks]
+        return np.unique(np.concatenate(found)) if found else np.array([], dtype='int64')
+
+    def match(self, payee_names, amounts, tolerance_paise=0, threshold=NAME_MATCH_THRESHOLD):
+        """
+        Best employee for each payee. Confidence is 0.8 x name similarity
+        (on sorted tokens) plus 0.2 when the amount equals that employee's
+        net pay within tolerance. Payees below ``threshold`` are left out.
+        """
+        matched = []
+        for row, (tokens, amount) in enumerate(zip(name_tokens(pd.Series(payee_names)), amounts)):
+            positions = self.candidates(tokens)
+            if not len(positions):
+                continue
+            target = ' '.join(sorted(tokens))
+            best = None
+            for pos in positions:
+                score = SequenceMatcher(None, target, self.sorted_names[pos]).ratio()
+                amount_match = self.net_pay is not None and abs(int(amount) - int(self.net_pay[pos])) <= tolerance_paise
+                confidence = 0.8 * score + 0.2 * amount_match
+                if best is None or confidence > best[3]:
+                    best = (pos, score, amount_match, confidence)
+            if best[3] >= threshold:
+                matched.append((row, self.keys[best[0]], round(best[1], 3), best[2], round(best[3], 3)))
+        return pd.DataFrame(matched, columns=['Row', 'Employee_Key', 'Name_Score', 'Amount_Match', 'Confidence'])
+
+
+class ColumnRoleMatcher:
+    """
+    Column-role resolution compiled once from a role/terms table.
+
+    Each role's terms become one regex, and a header is resolved in a single
+    pass over its columns, checking only roles that are still unresolved.
+    """
+
+    def __init__(self, role_terms):
+        self.version = hashlib.sha1(json.dumps(role_terms, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        self.patterns = {
+            kind: [(role, re.compile('|'.join(re.escape(term) for term in terms))) for role, terms in roles]
+            for kind, roles in role_terms.items()
+        }
+
+    def resolve(self, header, kind):
+        unresolved = list(self.patterns.get(kind, []))
+        columns = {}
+        for col in header:
+            if not unresolved:
+                break
+            col_lower = str(col).lower()
+            for entry in list(unresolved):
+                if entry[1].search(col_lower):
+                    columns[entry[0]] = col
+                    unresolved.remove(entry)
+        return columns
+
+
+COLUMN_MATCHER = ColumnRoleMatcher(COLUMN_ROLE_TERMS)
+_COLUMN_ROLE_LOCK = threading.Lock()
+
+
+def header_fingerprint(header, kind):
+    """Stable fingerprint of a header layout for one source kind and matcher version"""
+    payload = '\x1f'.join([COLUMN_MATCHER.version, kind] + [str(col) for col in header])
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def load_column_role_cache(path):
+    """Read persisted header-fingerprint -> column-role resolutions"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_column_role_cache(path, cache):
+    """Persist resolutions atomically so concurrent runs never see a partial file"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"⚠️ Could not save column role cache: {e}")
+
+
+def _find_header_row(rows):
+    """Index of the first text-heavy row within the scan window, else None"""
+    for idx, row in enumerate(rows[:HEADER_SCAN_ROWS]):
+        if _looks_like_header(row):
+            return idx
+    return None
+
+
+def sniff_file_format(head):
+    """Detect the real format of a source file from its first bytes"""
+    if head.startswith(b'PK\x03\x04'):
+        return 'xlsx'
+    if head.startswith(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'):
+        return 'xls'
+    text = head.lstrip(b'\xef\xbb\xbf \t\r\n').lower()
+    if text.startswith(b'<') and any(tag in text for tag in (b'<table', b'<html', b'<!doctype html')):
+        return 'html'
+    first_line = text.split(b'\n', 1)[0]
+    if b'\t' in first_line:
+        return 'tsv'
+    return 'csv'
+
+
+class _TableBuffer:
+    """
+    Column-wise accumulator for the rows of one table.
+
+    ``select`` is called with the header once it is known and returns the
+    column names to keep (None keeps all); cells of other columns are never
+    stored. ``row_filter`` is likewise called with the header and returns
+    (column name, allowed lower-cased values) or None; rows failing it are
+    dropped as they arrive.
+    """
+
+    def __init__(self, is_target=False, select=None, row_filter=None):
+        self.is_target = is_target
+        self.select = select
+        self.row_filter = row_filter
+        self.filter_pos = None
+        self.filter_values = None
+        self.header = None
+        self.positions = []
+        self.columns = []
+        self.text_columns = set()
+        self.pending_rows = []
+        self.row_count = 0
+
+    def add_row(self, row, is_header_row):
+        if not row or all(cell is None for cell in row):
+            return
+        if self.header is not None:
+            self.append(row)
+            return
+        if is_header_row:
+            self.set_header(row)
+            return
+        # No <th> row: the first text-heavy row within the scan window is the header
+        if _looks_like_header(row):
+            self.pending_rows = []
+            self.set_header(row)
+            return
+        self.pending_rows.append(row)
+        if len(self.pending_rows) >= HEADER_SCAN_ROWS:
+            self.finish_header()
+
+    def finish_header(self):
+        """Fall back to positional column names and keep buffered rows as data"""
+        if self.header is not None or not self.pending_rows:
+            return
+        pending, self.pending_rows = self.pending_rows, []
+        self.set_header([str(i) for i in range(max(len(r) for r in pending))])
+        for row in pending:
+            self.append(row)
+
+    def set_header(self, row):
+        header, seen = [], {}
+        for i, name in enumerate(row):
+            name = str(name).strip() if name is not None else f'Unnamed: {i}'
+            if name in seen:
+                seen[name] += 1
+                name = f'{name}.{seen[name]}'
+            else:
+                seen[name] = 0
+            header.append(name)
+        self.positions = list(range(len(header)))
+        if self.select is not None:
+            keep = self.select(header)
+            if keep is not None:
+                keep = set(keep)
+                self.positions = [i for i, name in enumerate(header) if name in keep]
+        self.header = [header[i] for i in self.positions]
+        self.columns = [[] for _ in self.positions]
+        if self.row_filter is not None:
+            spec = self.row_filter(header)
+            if spec is not None and spec[0] in header:
+                self.filter_pos = header.index(spec[0])
+                self.filter_values = spec[1]
+
+    def append(self, row):
+        width = len(row)
+        if self.filter_pos is not None:
+            value = row[self.filter_pos] if self.filter_pos < width else None
+            if value is None or str(value).strip().lower() not in self.filter_values:
+                return
+        for column, pos in zip(self.columns, self.positions):
+            column.append(row[pos] if pos < width else None)
+        self.row_count += 1
+
+    def to_frame(self):
+        """Convert the collected column lists into typed DataFrame columns"""
+        if self.header is None:
+            return pd.DataFrame()
+        data = {}
+        for pos, name, values in zip(self.positions, self.header, self.columns):
+            column = pd.Series(values, dtype=object)
+            data[name] = column if pos in self.text_columns else _coerce_column(column)
+        return pd.DataFrame(data)
+
+
+def stream_html_table(file_path, table_id=RMS_GRID_TABLE_ID, select=None, row_filter=None):
+    """Stream an HTML "xls" export and return one table as a typed DataFrame.
+
+    Rows go straight into per-column lists and each parsed <tr> is released
+    immediately, so no DOM or list of tables is ever held in memory. Parsing
+    stops at the end of the table with ``table_id``; when that id is absent
+    the largest top-level table wins, as with pd.read_html. ``select`` and
+    ``row_filter`` project columns and rows as described on _TableBuffer.
+    """
+    best = None
+    current = None
+    depth = 0
+    for event, element in etree.iterparse(file_path, events=('start', 'end'),
+                                          tag=('table', 'tr'), html=True,
+                                          encoding='utf-8', recover=True):
+        if element.tag == 'table':
+            if event == 'start':
+                depth += 1
+                if depth == 1:
+                    current = _TableBuffer(table_id is not None and element.get('id') == table_id,
+                                           select, row_filter)
+                continue
+            depth -= 1
+            if depth == 0 and current is not None:
+                current.finish_header()
+                if current.is_target:
+                    best = current
+                    break
+                if current.header is not None and (best is None or current.row_count > best.row_count):
+                    best = current
+                current = None
+            element.clear()
+            continue
+
+        if event != 'end' or depth != 1 or current is None:
+            continue
+        row, is_header_row = [], True
+        for cell in element:
+            if cell.tag not in ('td', 'th'):
+                continue
+            if cell.tag == 'td':
+                is_header_row = False
+            style = cell.get('style') or ''
+            if 'mso-number-format' in style and '@' in style:
+                current.text_columns.add(len(row))
+            value = ' '.join(''.join(cell.itertext()).split())
+            row.append(value if value else None)
+        current.add_row(row, is_header_row)
+        # Release the parsed row and anything before it
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+    return best.to_frame() if best is not None else pd.DataFrame()
+
 
 class EnhancedReconciliation:
-    def __init__(self):
+    def __init__(self, cache_dir=None, use_cache=True, load_workers=None, load_executor='thread',
+                 project_columns=True, carry_columns=None, tolerance_amount=1.0, bank_match_mode='amount',
+                 name_match_threshold=NAME_MATCH_THRESHOLD, chunk_rows=DEFAULT_CHUNK_ROWS, state_dir=None,
+                 reference_index_file=BANK_REFERENCE_INDEX_FILE, column_role_cache_file=COLUMN_ROLE_CACHE_FILE,
+                 run_state_dir=RUN_STATE_DIR, carry_forward_file=CARRY_FORWARD_FILE,
+                 identity_index_file=IDENTITY_INDEX_FILE):
         # Branch mapping for Koenig Solutions locations
         self.branch_mapping = {
             'gurgaon': 'Gurgaon',
@@ -57,6 +1208,82 @@ class EnhancedReconciliation:
             'consultant': 'Consultant'
         }
         self.default_designation = 'Other Staff'
+        
+        # Parser registry keyed by the sniffed file format
+        self.parsers = {
+            'xlsx': self._parse_xlsx,
+            'xls': self._parse_xls,
+            'html': self._parse_html,
+            'tsv': self._parse_tsv,
+            'csv': self._parse_csv
+        }
+        # Which format/parser each source was loaded with on the last read
+        self.load_log = {}
+        
+        # Parsed frames are cached on disk keyed by file content (needs pyarrow)
+        self.parse_cache = ParseCache(cache_dir) if use_cache and PARQUET_AVAILABLE else None
+        
+        # Parallel load stage: 'thread' or 'process' pool; None sizes it per run
+        self.load_workers = load_workers
+        self.load_executor = load_executor
+        
+        # Column projection: only role columns are parsed, plus any extra
+        # columns per source to carry through to the report,
+        # e.g. {'salary': ['UAN', 'BankAccNo']}
+        self.project_columns = project_columns
+        self.carry_columns = carry_columns or {}
+        
+        # Cross-run stores live under ``state_dir`` (opt-in); any one of them is
+        # turned off by passing None for its file
+        self.state_dir = state_dir
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        state_path = lambda name: os.path.join(state_dir, name) if state_dir and name else None
+        reference_index_file, column_role_cache_file, run_state_dir, carry_forward_file, identity_index_file = map(
+            state_path, (reference_index_file, column_role_cache_file, run_state_dir, carry_forward_file,
+                         identity_index_file))
+        
+        # Column roles resolved per header layout, persisted across runs
+        self.column_role_cache_file = column_role_cache_file
+        self.column_role_cache = load_column_role_cache(column_role_cache_file) if column_role_cache_file else {}
+        
+        # Block size for streaming large delimited bank statements
+        self.chunk_rows = chunk_rows
+        
+        # Amount tolerance (₹) from the dashboard, held as integer paise
+        self.tolerance_paise = rupees_to_paise(tolerance_amount)
+        
+        # 'amount' checks net pay against the SOA; 'presence' only checks the employee appears
+        if bank_match_mode not in BANK_MATCH_MODES:
+            raise ValueError(f"Unknown bank match mode: {bank_match_mode}")
+        self.bank_match_mode = bank_match_mode
+        
+        # Minimum confidence for linking a bank row without an ID by payee name
+        self.name_match_threshold = name_match_threshold
+        self.bank_name_matches = pd.DataFrame()
+        
+        # UTR -> employee payments, persisted so bulk transfers resolve across months
+        self.reference_index = BankReferenceIndex(reference_index_file) if reference_index_file and PARQUET_AVAILABLE else None
+        self.bulk_transfers_found = pd.DataFrame()
+        self.match_matrix = pd.DataFrame()
+        # Last run's per-SOA (payments, bulk transfers), e.g. for batch ledger settlement
+        self.source_inputs = {}
+        
+        # UAN/PRAN/PAN/bank account -> EmpCode, so statutory files resolve to salary employees
+        self.identity_index = EmployeeIdentityIndex(identity_index_file) if identity_index_file else None
+        # This run's salary employee keys; source keys outside them are checked against the index
+        self.salary_keys = None
+        # Non-blank employee IDs per source that no key could be parsed from
+        self.unparsed_keys = pd.DataFrame(columns=UNPARSED_KEY_COLUMNS)
+        # Non-blank amounts per source that did not parse (counted as 0)
+        self.unparsed_amounts = pd.DataFrame(columns=UNPARSED_AMOUNT_COLUMNS)
+        
+        # Last run's inputs; a rerun with the same salary file re-matches only changed sources
+        self.run_state = ReconciliationState(run_state_dir) if run_state_dir and PARQUET_AVAILABLE else None
+        
+        # Payments and unpaid salary that cross SOA windows, rolled from run to run
+        self.carry_forward = CarryForwardLedger(carry_forward_file) if carry_forward_file and PARQUET_AVAILABLE else None
+        self.run_period = None
     
     def map_employee_to_branch(self, location):
         """Map employee location to branch"""
@@ -86,184 +1313,724 @@ class EnhancedReconciliation:
     
     def detect_file_columns(self, df, file_type):
         """Detect relevant columns based on file type"""
-        columns = {}
+        return self.resolve_columns(df.columns, file_type)
+    
+    def resolve_columns(self, header, file_type):
+        """
+        Resolve column roles for a header, reusing the cached resolution when
+        the same header layout has been seen before (in this or a past run).
+        """
+        header = [str(col) for col in header]
+        fingerprint = header_fingerprint(header, file_type)
+        with _COLUMN_ROLE_LOCK:
+            cached = self.column_role_cache.get(fingerprint)
+        if cached is not None:
+            return dict(cached)
         
-        if file_type == 'salary':
-            # Employee ID
-            for col in df.columns:
-                col_lower = str(col).lower()
-                if any(term in col_lower for term in ['empcode', 'employee id', 'emp_id', 'id']):
-                    columns['employee_id'] = col
-                    break
-            
-            # Employee Name
-            for col in df.columns:
-                col_lower = str(col).lower()
-                if any(term in col_lower for term in ['employeename', 'employee name', 'name']):
-                    columns['employee_name'] = col
-                    break
-            
-            # Location
-            for col in df.columns:
-                col_lower = str(col).lower()
-                if any(term in col_lower for term in ['baselocation', 'location', 'branch']):
-                    columns['location'] = col
-                    break
-            
-            # Designation
-            for col in df.columns:
-                col_lower = str(col).lower()
-                if any(term in col_lower for term in ['designation', 'role', 'position']):
-                    columns['designation'] = col
-                    break
-            
-            # Department
-            for col in df.columns:
-                col_lower = str(col).lower()
-                if any(term in col_lower for term in ['department', 'dept']):
-                    columns['department'] = col
-                    break
-            
-            # Salary amounts
-            for col in df.columns:
-                col_lower = str(col).lower()
-                if any(term in col_lower for term in ['basic', 'salary', 'net']):
-                    columns['basic_salary'] = col
-                    break
-                    
-        elif file_type == 'bank':
-            # Employee column with Name-ID format
-            for col in df.columns:
-                col_lower = str(col).lower()
-                if 'employee' in col_lower:
-                    columns['employee'] = col
-                    break
-            
-            # Amount
-            for col in df.columns:
-                col_lower = str(col).lower()
-                if any(term in col_lower for term in ['amount', 'salary', 'paid']):
-                    columns['amount'] = col
-                    break
-                    
-        elif file_type in ['epf', 'nps']:
-            # Employee ID
-            for col in df.columns:
-                col_lower = str(col).lower()
-                if any(term in col_lower for term in ['employee', 'emp', 'id', 'uan', 'pran']):
-                    columns['employee_id'] = col
-                    break
-            
-            # Amount
-            for col in df.columns:
-                col_lower = str(col).lower()
-                if any(term in col_lower for term in ['amount', 'contribution', 'deduction']):
-                    columns['amount'] = col
-                    break
-                    
-        elif file_type == 'tds':
-            # Employee ID
-            for col in df.columns:
-                col_lower = str(col).lower()
-                if any(term in col_lower for term in ['employee', 'emp', 'id']):
-                    columns['employee_id'] = col
-                    break
-            
-            # TDS Amount
-            for col in df.columns:
-                col_lower = str(col).lower()
-                if any(term in col_lower for term in ['tds', 'tax', 'deducted']):
-                    columns['tds_amount'] = col
-                    break
+        columns = COLUMN_MATCHER.resolve(header, file_type)
+        with _COLUMN_ROLE_LOCK:
+            self.column_role_cache[fingerprint] = columns
+            if self.column_role_cache_file:
+                save_column_role_cache(self.column_role_cache_file, self.column_role_cache)
+        return dict(columns)
+    
+    def merge_column_roles(self, roles):
+        """Adopt column roles resolved in worker processes and persist them once"""
+        with _COLUMN_ROLE_LOCK:
+            new = {fingerprint: columns for fingerprint, columns in roles.items()
+                   if fingerprint not in self.column_role_cache}
+            if not new:
+                return
+            self.column_role_cache.update(new)
+            if self.column_role_cache_file:
+                save_column_role_cache(self.column_role_cache_file, self.column_role_cache)
+    
+    def _parse_html(self, file_path, select=None, row_filter=None):
+        """RMS HTML "xls" export - stream straight to the grid table"""
+        return stream_html_table(file_path, select=select, row_filter=row_filter)
+    
+    def _parse_xlsx(self, file_path, select=None, row_filter=None):
+        """Excel 2007+ workbook - stream rows of the first sheet"""
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            buffer = _TableBuffer(select=select, row_filter=row_filter)
+            for row in workbook.worksheets[0].iter_rows(values_only=True):
+                buffer.add_row(list(row), False)
+            buffer.finish_header()
+        finally:
+            workbook.close()
+        return buffer.to_frame()
+    
+    def _parse_xls(self, file_path, select=None, row_filter=None):
+        """Legacy OLE2 Excel workbook"""
+        df = self._promote_header_row(pd.read_excel(file_path, engine='xlrd', header=None), select)
+        return self._filter_rows(df, row_filter)
+    
+    def _parse_tsv(self, file_path, select=None, row_filter=None):
+        """Tab-separated text (bank SOA exports named .xls)"""
+        return self._read_delimited(file_path, '\t', select, row_filter)
+    
+    def _parse_csv(self, file_path, select=None, row_filter=None):
+        """Comma-separated text"""
+        return self._read_delimited(file_path, ',', select, row_filter)
+    
+    def _read_delimited(self, file_path, sep, select=None, row_filter=None):
+        """
+        Read delimited text, parsing only the selected columns. With a row
+        filter the file is streamed in ``chunk_rows`` blocks and only matching
+        rows are kept, so memory does not grow with the statement size.
+        """
+        options = {'sep': sep, 'encoding': 'utf-8', 'encoding_errors': 'replace'}
+        usecols = None
+        if select is not None or row_filter is not None:
+            header = [str(col).strip() for col in pd.read_csv(file_path, nrows=0, **options).columns]
+            keep = select(header) if select is not None else None
+            if keep is not None:
+                keep = set(keep)
+                usecols = [i for i, name in enumerate(header) if name in keep]
+        if row_filter is None:
+            return pd.read_csv(file_path, usecols=usecols, **options)
         
-        return columns
+        kept = []
+        with pd.read_csv(file_path, usecols=usecols, chunksize=self.chunk_rows, **options) as reader:
+            for chunk in reader:
+                chunk.columns = [str(col).strip() for col in chunk.columns]
+                kept.append(self._filter_rows(chunk, row_filter))
+        if not kept:
+            return pd.read_csv(file_path, usecols=usecols, nrows=0, **options)
+        return pd.concat(kept, ignore_index=True)
+    
+    def _filter_rows(self, df, row_filter):
+        """Apply a header-resolved row filter to an already parsed frame"""
+        if row_filter is None:
+            return df
+        spec = row_filter(list(df.columns))
+        if spec is None or spec[0] not in df.columns:
+            return df
+        values = df[spec[0]].astype('string').str.strip().str.lower()
+        return df[values.isin(spec[1]).fillna(False).to_numpy(dtype=bool)]
+    
+    def _promote_header_row(self, raw_df, select=None):
+        """Use the first text-heavy row as the header (skips report title rows)"""
+        if raw_df.empty:
+            return raw_df
+        head_rows = raw_df.head(HEADER_SCAN_ROWS).values.tolist()
+        header_idx = _find_header_row(head_rows)
+        if header_idx is None:
+            header_idx = 0
+        header = [
+            f'Unnamed: {i}' if pd.isna(name) else str(name).strip()
+            for i, name in enumerate(head_rows[header_idx])
+        ]
+        positions = list(range(len(header)))
+        if select is not None:
+            keep = select(header)
+            if keep is not None:
+                keep = set(keep)
+                positions = [i for i, name in enumerate(header) if name in keep]
+        df = raw_df.iloc[header_idx + 1:, positions].reset_index(drop=True)
+        df.columns = [header[i] for i in positions]
+        for col in df.columns:
+            df[col] = _coerce_column(df[col])
+        return df
+    
+    def column_selector(self, file_type):
+        """
+        Phase one of a projected load: given a file's header, resolve the
+        column roles for this source and return the columns worth parsing
+        (role columns plus any requested carry-through columns).
+        """
+        if not self.project_columns:
+            return None
+        kind = source_kind(file_type)
+        carry = list(self.carry_columns.get(file_type, []))
+        
+        def select(header):
+            roles = self.resolve_columns(header, kind)
+            if not roles:
+                # Unknown layout - keep everything rather than guess
+                return None
+            keep = set(roles.values()) | set(carry)
+            return [name for name in header if name in keep]
+        
+        return select
+    
+    def source_row_filter(self, file_type):
+        """
+        Row filter for a source: returns a callable that maps a header to
+        (column, allowed lower-cased values), e.g. bank SOAs keep only
+        ACCHead == 'Salary Exp-Payable'.
+        """
+        spec = SOURCE_ROW_FILTERS.get(source_kind(file_type))
+        if spec is None:
+            return None
+        role, values = spec
+        allowed = {value.lower() for value in values}
+        kind = source_kind(file_type)
+        
+        def row_filter(header):
+            col = self.resolve_columns(header, kind).get(role)
+            return (col, allowed) if col is not None else None
+        
+        return row_filter
+    
+    def detect_file_format(self, file_path):
+        """Sniff the real format of a file from its header bytes"""
+        with open(file_path, 'rb') as f:
+            return sniff_file_format(f.read(SNIFF_BYTES))
+    
+    def apply_schema(self, df, file_type):
+        """Convert a freshly parsed frame to its source schema's dtypes"""
+        schema = SOURCE_SCHEMAS.get(source_kind(file_type))
+        if schema is None or df.empty:
+            return df
+        columns = self.detect_file_columns(df, source_kind(file_type))
+        
+        # A column detected under several amount roles is converted once
+        for col in self.amount_columns(df, file_type):
+            raw = df[col]
+            df[col], unparsed = parse_amounts(raw)
+            if unparsed.any():
+                df[UNPARSED_AMOUNT_PREFIX + col] = raw.astype(TEXT_DTYPE).where(unparsed)
+        
+        for role, formats in schema['dates'].items():
+            if role in columns:
+                df[columns[role]] = parse_dates(df[columns[role]], formats)
+        
+        for role in schema['text']:
+            col = columns.get(role)
+            if col is not None and not pd.api.types.is_numeric_dtype(df[col]):
+                df[col] = df[col].astype(TEXT_DTYPE).str.strip()
+        
+        # Low-cardinality labels become categoricals over Arrow strings
+        for role in schema['categories']:
+            col = columns.get(role)
+            if col is not None and not pd.api.types.is_numeric_dtype(df[col]):
+                df[col] = df[col].astype(TEXT_DTYPE).str.strip().astype('category')
+        
+        return df
+    
+    def _map_labels(self, series, mapper):
+        """Apply a label mapper once per distinct value; returns a categorical"""
+        codes, uniques = pd.factorize(series, use_na_sentinel=False)
+        labels = np.array([mapper(None if pd.isna(value) else value) for value in uniques], dtype=object)
+        return pd.Series(pd.Categorical(labels[codes]), index=series.index)
+    
+    def amount_columns(self, df, file_type):
+        """Columns of ``df`` that hold int64 paise under the source schema"""
+        schema = SOURCE_SCHEMAS.get(source_kind(file_type))
+        if schema is None:
+            return []
+        columns = self.detect_file_columns(df, source_kind(file_type))
+        return list(dict.fromkeys(columns[role] for role in schema['amounts'] if role in columns))
+    
+    def to_report_frame(self, df, paise_columns):
+        """Copy of ``df`` with paise columns converted back to rupees"""
+        report_df = df.copy()
+        for col in paise_columns:
+            if col in report_df.columns:
+                report_df[col] = paise_to_rupees(report_df[col])
+        return report_df
+    
+    def _summary_amount_column(self, salary_df):
+        """Salary column the summaries total - the same resolution as the load"""
+        return self.detect_file_columns(salary_df, 'salary').get('basic_salary', 'Basic')
+    
+    def _cache_variant(self, file_type):
+        """Part of the parse-cache key that depends on how the file is projected"""
+        if not self.project_columns:
+            return 'all'
+        carry = ','.join(sorted(self.carry_columns.get(file_type, [])))
+        return f"{source_kind(file_type)}|{COLUMN_MATCHER.version}|{carry}"
     
     def read_file_smart(self, file_path, file_type):
-        """Smart file reader that handles different formats"""
+        """Smart file reader: sniff the real format once and dispatch to its parser"""
         try:
-            file_ext = Path(file_path).suffix.lower()
-            
-            if file_ext in ['.xls', '.xlsx']:
-                # Check if it's actually HTML
-                with open(file_path, 'rb') as f:
-                    first_bytes = f.read(20)
-                    if b'<Table>' in first_bytes or b'<table>' in first_bytes:
-                        # HTML table
-                        tables = pd.read_html(file_path)
-                        df = max(tables, key=len)
-                        
-                        # Fix headers if needed
-                        if df.columns.dtype == 'int64':
-                            for row_idx in range(min(10, len(df))):
-                                row_data = df.iloc[row_idx]
-                                text_count = sum(1 for cell in row_data if isinstance(cell, str) and len(str(cell)) > 2)
-                                if text_count > len(row_data) * 0.5:
-                                    df.columns = row_data.astype(str)
-                                    df = df.iloc[row_idx+1:].reset_index(drop=True)
-                                    break
-                    else:
-                        # Regular Excel
-                        try:
-                            df = pd.read_excel(file_path, engine='openpyxl')
-                        except:
-                            df = pd.read_excel(file_path, engine='xlrd')
-            
-            elif file_ext == '.csv':
-                df = pd.read_csv(file_path)
-            
-            elif file_ext == '.txt':
-                # Try tab-separated first
-                try:
-                    df = pd.read_csv(file_path, sep='\t')
-                except:
-                    df = pd.read_csv(file_path)
-            
+            cache_key = None
+            if self.parse_cache is not None:
+                digest, head = file_digest(file_path, SNIFF_BYTES)
+                cache_key = self.parse_cache.make_key(digest, PARSER_VERSION, self._cache_variant(file_type))
+                df = self.parse_cache.get(cache_key)
+                if df is not None:
+                    self.load_log[file_type] = {
+                        'file': str(file_path),
+                        'format': 'cache',
+                        'parser': 'parse_cache',
+                        'unparsed_amounts': self.take_unparsed_amounts(df)
+                    }
+                    print(f"⚡ Loaded {file_type} file from cache: {df.shape[0]} rows, {df.shape[1]} columns")
+                    return df
+                file_format = sniff_file_format(head)
             else:
-                # Try as tab-separated (for .xls that are actually TSV)
-                try:
-                    df = pd.read_csv(file_path, sep='\t', encoding='utf-8')
-                except:
-                    df = pd.read_csv(file_path, encoding='utf-8')
+                file_format = self.detect_file_format(file_path)
+            
+            parser = self.parsers[file_format]
+            df = parser(file_path, select=self.column_selector(file_type),
+                        row_filter=self.source_row_filter(file_type))
             
             # Clean column names
             df.columns = [str(col).strip() for col in df.columns]
+            df = self.apply_schema(df, file_type)
             
-            print(f"✅ Loaded {file_type} file: {df.shape[0]} rows, {df.shape[1]} columns")
+            if cache_key is not None:
+                self.parse_cache.put(cache_key, df)
+            
+            self.load_log[file_type] = {
+                'file': str(file_path),
+                'format': file_format,
+                'parser': parser.__name__,
+                'unparsed_amounts': self.take_unparsed_amounts(df)
+            }
+            print(f"✅ Loaded {file_type} file ({file_format}): {df.shape[0]} rows, {df.shape[1]} columns")
             return df
             
         except Exception as e:
             print(f"❌ Error reading {file_type} file {file_path}: {e}")
             return None
     
-    def process_bank_file(self, bank_df):
-        """Extract employee IDs from bank file Employee column (Name-ID format)"""
-        employee_ids = []
+    def take_unparsed_amounts(self, df):
+        """Pop the raw text apply_schema kept for unparseable amounts; returns Row/Column/Value rows"""
+        found = []
+        for col in [col for col in df.columns if str(col).startswith(UNPARSED_AMOUNT_PREFIX)]:
+            values = df.pop(col).dropna()
+            found.append(pd.DataFrame({'Row': values.index.to_numpy(), 'Column': col[len(UNPARSED_AMOUNT_PREFIX):],
+                                       'Value': values.to_numpy()}))
+        return pd.concat(found, ignore_index=True) if found else None
+    
+    def load_sources(self, files):
+        """
+        Parse all source files concurrently and detect their columns as each
+        frame arrives. Returns (data, columns) keyed by source type; sources
+        that are missing or fail to load map to None / {}.
+        """
+        data = {file_type: None for file_type in SOURCE_TYPES}
+        columns = {file_type: {} for file_type in SOURCE_TYPES}
         
-        # Find Employee column
-        employee_col = None
-        for col in bank_df.columns:
-            if 'employee' in str(col).lower():
-                employee_col = col
-                break
+        pending = {}
+        for file_type, file_path in files.items():
+            if file_path and os.path.exists(file_path):
+                pending[file_type] = file_path
+            else:
+                print(f"⚠️ {file_type} file not found: {file_path}")
+                data[file_type] = None
+        
+        if not pending:
+            return data, columns
         
+        workers = self.load_workers or len(pending)
+        if self.load_executor == 'process' and not self.load_workers:
+            workers = min(workers, os.cpu_count() or 1)
+        workers = max(1, min(workers, len(pending)))
+        print(f"📁 Loading {len(pending)} files with {workers} {self.load_executor} worker(s)...")
+        loaders = {source.name: source.loader for source in RECONCILIATION_SOURCES}
+        
+        if self.load_executor == 'process':
+            # The parse cache and load log live in the workers; merge logs and column roles back here
+            executor = ProcessPoolExecutor(max_workers=workers)
+            submit = lambda ft, fp: executor.submit(_load_source_worker, self, loaders.get(ft, read_source_file), ft, fp)
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers)
+            submit = lambda ft, fp: executor.submit(loaders.get(ft, read_source_file), self, fp, ft)
+        
+        with executor:
+            futures = {submit(ft, fp): ft for ft, fp in pending.items()}
+            for future in as_completed(futures):
+                file_type = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"❌ Error loading {file_type} file: {e}")
+                    result = None
+                if self.load_executor == 'process' and result is not None:
+                    result, log_entry, roles = result
+                    if log_entry:
+                        self.load_log[file_type] = log_entry
+                    self.merge_column_roles(roles)
+                data[file_type] = result
+                if result is not None:
+                    columns[file_type] = self.detect_file_columns(result, source_kind(file_type))
+        
+        return data, columns
+    
+    def _bank_structure(self, bank_df):
+        """Transaction keys, parent keys and bulk-parent mask of a bank SOA"""
+        bank_cols = self.detect_file_columns(bank_df, 'bank')
+        txn_col, group_col = bank_cols.get('transaction_id'), bank_cols.get('group_id')
+        if txn_col:
+            txn_keys = normalize_keys(bank_df[txn_col])
+        else:
+            txn_keys = pd.Series(SYNTHETIC_TXN_PREFIX + bank_df.index.astype(str), index=bank_df.index, dtype=TEXT_DTYPE)
+        if group_col:
+            group_keys = normalize_keys(bank_df[group_col])
+        else:
+            group_keys = pd.Series(pd.NA, index=bank_df.index, dtype=TEXT_DTYPE)
+        has_parent = (group_keys.notna() & (group_keys != '0')).to_numpy(dtype=bool, na_value=False)
+        is_parent = txn_keys.isin(group_keys[has_parent].unique()).to_numpy(dtype=bool, na_value=False)
+        # Children point at their bulk parent; everything else is its own parent
+        parent_keys = group_keys.where(has_parent, txn_keys)
+        return bank_cols, txn_keys, parent_keys, is_parent
+    
+    def parse_bank_references(self, bank_df):
+        """Narration fields (channel, UTR, batch, payee) for every SOA row"""
+        narration_col = self.detect_file_columns(bank_df, 'bank').get('narration')
+        if narration_col is None:
+            return pd.DataFrame({field: pd.Series(pd.NA, index=bank_df.index, dtype=TEXT_DTYPE)
+                                 for field in NARRATION_FIELDS})
+        return parse_narrations(bank_df[narration_col])
+    
+    def bank_payments(self, bank_df, bank_source='', references=None):
+        """
+        One row per salary payout in a bank SOA (see BANK_PAYMENT_DTYPES).
+        Bulk-upload parent rows (whose transaction ID is another row's GroupId)
+        are left out: their children carry the per-employee payments and
+        inherit the parent's UTR, channel and batch.
+        """
+        bank_cols, txn_keys, parent_keys, is_parent = self._bank_structure(bank_df)
+        employee_col = bank_cols.get('employee')
         if not employee_col:
-            return []
+            return pd.DataFrame({col: pd.Series([], dtype=dtype) for col, dtype in BANK_PAYMENT_DTYPES.items()})
+        if references is None:
+            references = self.parse_bank_references(bank_df)
         
-        # Extract IDs from Name-ID format
-        for value in bank_df[employee_col]:
-            if pd.isna(value):
-                continue
+        refs_by_txn = references.set_axis(txn_keys.to_numpy()).loc[lambda df: ~df.index.duplicated()]
+        keep = ~is_parent
+        rows = bank_df[keep]
+        parents = parent_keys[keep]
+        
+        employee_keys, payee_names, unparsed = split_employee_field(rows[employee_col])
+        if 'bank_account' in bank_cols:
+            # Beneficiary account numbers identify the payee where the Name-ID field doesn't
+            resolved_keys, resolved = self.identity_keys(rows, bank_cols, employee_keys)
+            employee_keys = pd.Series(resolved_keys, index=rows.index)
+            unparsed = unparsed & ~resolved
+        self.record_unparsed_keys(bank_source, rows[employee_col], unparsed)
+        # No name in the Employee field: take the payee from the narration
+        payee_names = payee_names.where(payee_names != '', references.loc[rows.index, 'payee'].fillna(''))
+        amount_col, date_col = bank_cols.get('amount'), bank_cols.get('date')
+        amounts = rows[amount_col].to_numpy(dtype='int64') if amount_col else np.zeros(len(rows), dtype='int64')
+        dates = rows[date_col] if date_col and pd.api.types.is_datetime64_any_dtype(rows[date_col]) else pd.NaT
+        payments = pd.DataFrame({
+            'Employee_Key': employee_keys.to_numpy(),
+            'Payee_Name': payee_names.to_numpy(),
+            'Amount': amounts,
+            'Bank_Source': bank_source,
+            'Transaction_ID': txn_keys[keep].to_numpy(),
+            'Parent_Transaction_ID': parents.to_numpy(),
+            'Date': pd.Series(dates, index=rows.index).to_numpy(dtype='datetime64[ns]')
+        })
+        for field, col in [('utr', 'UTR'), ('channel', 'Channel'), ('batch_id', 'Batch_ID')]:
+            payments[col] = parents.map(refs_by_txn[field]).to_numpy()
+        return payments.astype(BANK_PAYMENT_DTYPES)
+    
+    def bulk_transfers(self, bank_df, bank_source='', references=None):
+        """
+        Lump-sum SOA rows with no employee (bulk uploads) and what explains
+        them: the child rows pointing at them by GroupId in this SOA, or
+        payments recorded under the same transfer or UTR in the reference index.
+        """
+        bank_cols, txn_keys, parent_keys, is_parent = self._bank_structure(bank_df)
+        employee_col, amount_col = bank_cols.get('employee'), bank_cols.get('amount')
+        if employee_col is None or amount_col is None:
+            return pd.DataFrame()
+        if references is None:
+            references = self.parse_bank_references(bank_df)
+        
+        no_employee = bank_df[employee_col].astype('string').fillna('').str.strip() == ''
+        is_child = (parent_keys != txn_keys).to_numpy(dtype=bool, na_value=False)
+        bulk = (is_parent | (no_employee.to_numpy() & ~is_child))
+        if not bulk.any():
+            return pd.DataFrame()
+        
+        children = pd.DataFrame({'parent': parent_keys[is_child].to_numpy(),
+                                 'amount': bank_df.loc[is_child, amount_col].to_numpy(dtype='int64')})
+        child_totals = children.groupby('parent', sort=False)['amount'].agg(['size', 'sum'])
+        
+        transfers = pd.DataFrame({
+            'Bank_Source': bank_source,
+            'Transaction_ID': txn_keys[bulk].to_numpy(),
+            'Date': bank_df.loc[bulk, bank_cols['date']].to_numpy() if 'date' in bank_cols else pd.NaT,
+            'Channel': references.loc[bulk, 'channel'].to_numpy(),
+            'UTR': references.loc[bulk, 'utr'].to_numpy(),
+            'Batch_ID': references.loc[bulk, 'batch_id'].to_numpy(),
+            'Amount': bank_df.loc[bulk, amount_col].to_numpy(dtype='int64')
+        })
+        transfers['Child_Count'] = transfers['Transaction_ID'].map(child_totals['size']).fillna(0).astype('int64')
+        transfers['Child_Amount'] = transfers['Transaction_ID'].map(child_totals['sum']).fillna(0).astype('int64')
+        transfers['Explained_By'] = np.where(transfers['Child_Count'] > 0, 'GroupId', '')
+        
+        # Children not in this SOA (e.g. another statement window): try the index
+        pending = transfers['Child_Count'] == 0
+        if pending.any() and self.reference_index is not None:
+            known = self.reference_index.children(bank_source, transfers.loc[pending, 'Transaction_ID'])
+            known_totals = known.groupby('Parent_Transaction_ID')['Amount'].agg(['size', 'sum'])
+            found = pending & transfers['Transaction_ID'].isin(known_totals.index)
+            ids = transfers.loc[found, 'Transaction_ID']
+            transfers.loc[found, 'Child_Count'] = ids.map(known_totals['size']).to_numpy()
+            transfers.loc[found, 'Child_Amount'] = ids.map(known_totals['sum']).to_numpy()
+            transfers.loc[found, 'Explained_By'] = 'Reference Index'
             
-            value_str = str(value).strip()
-            if '-' in value_str:
-                employee_id = value_str.split('-')[-1].strip()
-                employee_ids.append(employee_id)
-            else:
-                employee_ids.append('')
+            # No GroupId link at all: payments that travelled under the same UTR
+            pending = (transfers['Child_Count'] == 0) & transfers['UTR'].notna()
+            if pending.any():
+                known = self.reference_index.lookup(transfers.loc[pending, 'UTR'])
+                known_totals = known.groupby('UTR')['Amount'].agg(['size', 'sum'])
+                found = pending & transfers['UTR'].isin(known_totals.index)
+                utrs = transfers.loc[found, 'UTR']
+                transfers.loc[found, 'Child_Count'] = utrs.map(known_totals['size']).to_numpy()
+                transfers.loc[found, 'Child_Amount'] = utrs.map(known_totals['sum']).to_numpy()
+                transfers.loc[found, 'Explained_By'] = 'Reference Index (UTR)'
+        
+        transfers['Explained'] = transfers['Child_Amount'] == transfers['Amount']
+        return transfers
+    
+    def match_unidentified_payments(self, payments, salary_keys, salary_names, net_pay=None):
+        """
+        Link bank rows without an employee ID to salary employees by payee name
+        and amount through a NameBlockIndex. Fills Employee_Key in place and
+        returns the accepted matches for review.
+        """
+        unidentified = payments.index[(payments['Employee_Key'] == MISSING_KEY).to_numpy()
+                                      & (payments['Payee_Name'].fillna('') != '').to_numpy()]
+        columns = ['Bank_Source', 'Transaction_ID', 'Payee_Name', 'Amount', 'Employee_Key',
+                   'Name_Score', 'Amount_Match', 'Confidence']
+        if not len(unidentified) or salary_names is None:
+            return pd.DataFrame(columns=columns)
+        
+        index = NameBlockIndex(salary_keys, salary_names, net_pay)
+        candidates = payments.loc[unidentified]
+        found = index.match(candidates['Payee_Name'].to_numpy(), candidates['Amount'].to_numpy(),
+                            self.tolerance_paise, self.name_match_threshold)
+        if found.empty:
+            return pd.DataFrame(columns=columns)
+        
+        rows = unidentified[found['Row'].to_numpy()]
+        payments.loc[rows, 'Employee_Key'] = found['Employee_Key'].to_numpy()
+        payments.loc[rows, 'Match_Confidence'] = found['Confidence'].to_numpy()
+        matched = payments.loc[rows, ['Bank_Source', 'Transaction_ID', 'Payee_Name', 'Amount', 'Employee_Key']]
+        for col in ['Name_Score', 'Amount_Match', 'Confidence']:
+            matched[col] = found[col].to_numpy()
+        return matched.reset_index(drop=True)
+    
+    def aggregate_bank_payments(self, payments, expected_per_employee=None):
+        """
+        One row per employee across every bank source: total paid (paise),
+        payment count, banks used, transaction IDs and a payment pattern.
+        A repeated amount to the same employee is flagged Duplicate when the
+        repeats share a UTR or date, or together overpay the expected net pay
+        (``expected_per_employee``, paise by key); several banks Multi-Bank;
+        several tranches in one bank (e.g. 50,000 + 50,000) Split.
+        """
+        payments = payments[payments['Employee_Key'] != MISSING_KEY]
+        # The same SOA row loaded twice is one payment, not a duplicate; rows
+        # without a transaction ID can't be told apart and are all kept
+        reloaded = (payments['Transaction_ID'].notna() &
+                    payments.duplicated(['Bank_Source', 'Transaction_ID', 'Employee_Key'])).to_numpy(dtype=bool)
+        payments = payments[~reloaded]
+        grouped = payments.groupby('Employee_Key', sort=False)
+        
+        summary = pd.DataFrame({
+            'Paid_Amount': grouped['Amount'].sum(),
+            'Payment_Count': grouped.size(),
+            'Match_Confidence': grouped['Match_Confidence'].min()
+        })
         
-        return employee_ids
+        # Banks as a bit pattern per employee, labelled from a lookup table
+        bank_codes, bank_names = pd.factorize(payments['Bank_Source'], sort=True)
+        bank_bits = pd.Series(np.left_shift(1, bank_codes), index=payments.index)
+        pairs = pd.DataFrame({'Employee_Key': payments['Employee_Key'], 'bits': bank_bits}).drop_duplicates()
+        bank_pattern = pairs.groupby('Employee_Key', sort=False)['bits'].sum()
+        bank_labels = np.array([', '.join(name for i, name in enumerate(bank_names) if pattern >> i & 1)
+                                for pattern in range(1 << len(bank_names))], dtype=object)
+        summary['Banks'] = bank_labels[bank_pattern.reindex(summary.index).to_numpy()]
+        bank_count = np.array([bin(pattern).count('1') for pattern in range(1 << len(bank_names))])
+        
+        ordered = payments.dropna(subset=['Transaction_ID']).sort_values(['Employee_Key', 'Transaction_ID'])
+        summary['Transaction_IDs'] = join_per_employee(ordered, 'Transaction_ID')
+        utrs = ordered.dropna(subset=['UTR']).drop_duplicates(['Employee_Key', 'UTR'])
+        summary['UTRs'] = join_per_employee(utrs, 'UTR')
+        
+        repeated = payments.duplicated(['Employee_Key', 'Amount'], keep=False)
+        same_reference = pd.Series(False, index=payments.index)
+        for col in ('UTR', 'Date'):
+            same_reference |= payments[col].notna() & payments.duplicated(['Employee_Key', 'Amount', col], keep=False)
+        by_key = lambda flags: flags.groupby(payments['Employee_Key'], sort=False).any().reindex(summary.index)
+        has_duplicate = by_key(same_reference)
+        if expected_per_employee is not None:
+            expected = expected_per_employee.reindex(summary.index)
+            overpaid = (summary['Paid_Amount'] > expected + self.tolerance_paise).fillna(False)
+            has_duplicate |= by_key(repeated) & overpaid
+        codes = np.select(
+            [has_duplicate.to_numpy(), bank_count[bank_pattern.reindex(summary.index).to_numpy()] > 1,
+             summary['Payment_Count'].to_numpy() > 1],
+            [0, 1, 2],
+            default=3
+        ).astype('int8')
+        summary['Payment_Pattern'] = pd.Categorical.from_codes(codes, BANK_PAYMENT_PATTERNS)
+        return summary
+    
+    def match_amounts(self, salary_keys, expected, paid_per_employee):
+        """
+        Compare the expected salary amount with what a source shows per
+        employee (hash-joined on the employee key). Returns (amount status,
+        paid, variance) with paid/variance in paise and variance = paid - expected.
+        """
+        paid = salary_keys.map(paid_per_employee)
+        found = paid.notna().to_numpy()
+        paid = paid.fillna(0).to_numpy(dtype='int64')
+        variance = np.where(found, paid - np.asarray(expected, dtype='int64'), 0)
+        
+        codes = np.select(
+            [~found, variance == 0, within_tolerance(variance, 0, self.tolerance_paise), variance < 0],
+            [4, 0, 1, 2],
+            default=3
+        ).astype('int8')
+        amount_status = pd.Series(pd.Categorical.from_codes(codes, AMOUNT_STATUSES), index=salary_keys.index)
+        return amount_status, pd.Series(paid, index=salary_keys.index), pd.Series(variance, index=salary_keys.index)
+    
+    def variance_buckets(self, amount_status, variance):
+        """Categorical VARIANCE_BUCKETS band per employee from the amount status and paise variance"""
+        status = amount_status.cat.codes.to_numpy()
+        limits = np.asarray(VARIANCE_BUCKET_LIMITS, dtype='int64') * PAISE_PER_RUPEE
+        sized = 2 + np.searchsorted(limits, np.abs(np.asarray(variance, dtype='int64')), side='left')
+        codes = np.select([status <= 1, status == AMOUNT_STATUSES.index('Missing')],
+                          [status, len(VARIANCE_BUCKETS) - 1], default=sized).astype('int8')
+        return pd.Series(pd.Categorical.from_codes(codes, VARIANCE_BUCKETS), index=amount_status.index)
     
-    def reconcile_six_files(self, files):
+    def employee_keys(self, values, source):
+        """Canonical int64 keys of a source's ID column, recording the IDs that don't parse"""
+        keys, unparsed = canonical_employee_keys(values)
+        self.record_unparsed_keys(source, values, unparsed)
+        return keys
+    
+    def record_unparsed_keys(self, source, values, unparsed):
+        """Add a source's unparsed IDs (by parsed row) to the Unparsed_Keys report"""
+        if not unparsed.any():
+            return
+        rows = values[unparsed]
+        found = pd.DataFrame({'Source': source, 'Row': rows.index.to_numpy(), 'Value': rows.astype(str).to_numpy()})
+        self.unparsed_keys = pd.concat([self.unparsed_keys, found], ignore_index=True)
+    
+    def record_unparsed_amounts(self, file_type, source):
+        """Add the unparseable amounts of the last load of ``file_type`` to the Unparsed_Amounts report"""
+        found = self.load_log.get(file_type, {}).get('unparsed_amounts')
+        if found is None or found.empty:
+            return
+        found = found.assign(Source=source)[UNPARSED_AMOUNT_COLUMNS]
+        self.unparsed_amounts = pd.concat([self.unparsed_amounts, found], ignore_index=True)
+    
+    def update_identity_index(self, salary_df, salary_cols):
+        """Record the salary sheet's UAN/PRAN/PAN/bank account numbers against its EmpCodes"""
+        roles = [role for role in IDENTITY_ROLES if role in salary_cols]
+        if self.identity_index is None or not roles or 'employee_id' not in salary_cols:
+            return
+        keys, _ = canonical_employee_keys(salary_df[salary_cols['employee_id']])
+        written, moved = self.identity_index.update(
+            keys, {role: salary_df[salary_cols[role]] for role in roles}, self.run_period)
+        if written:
+            held = self.identity_index.counts()
+            print("🪪 Identity index: " + ", ".join(f"{IDENTITY_LABELS[role]} {held.get(role, 0)}" for role in roles))
+        if moved:
+            print(f"⚠️ {moved} identifiers now belong to a different employee than before")
+    
+    def identity_keys(self, df, columns, keys):
+        """
+        Fill ``keys`` that are missing or not a salary employee from the
+        frame's identifier columns (in IDENTITY_ROLES order) through the
+        identity index; a key that already names a salary employee is kept.
+        Returns (keys, resolved).
+        """
+        keys = np.asarray(keys, dtype='int64').copy()
+        resolved = np.zeros(len(keys), dtype=bool)
+        if self.identity_index is None:
+            return keys, resolved
+        unknown = keys == MISSING_KEY
+        if self.salary_keys is not None:
+            unknown |= ~np.isin(keys, self.salary_keys)
+        for role in IDENTITY_ROLES:
+            if role not in columns or not unknown.any():
+                continue
+            rows = np.flatnonzero(unknown)
+            found = self.identity_index.resolve(role, df[columns[role]].iloc[rows])
+            rows = rows[found != MISSING_KEY]
+            keys[rows] = found[found != MISSING_KEY]
+            resolved[rows] = True
+            unknown[rows] = False
+            if len(rows):
+                print(f"   Resolved {len(rows)} rows through {IDENTITY_LABELS[role]}")
+        return keys, resolved
+    
+    def source_keys(self, source, df, columns):
+        """
+        Employee_Key/Amount rows of a non-bank source, or None when it has
+        neither its key column nor an identifier column. Rows whose key is
+        missing, unparsed or not a salary employee are resolved by their
+        identifiers (UAN, PRAN, PAN) where possible. Amounts are paise (0
+        without an amount column).
+        """
+        if source.key not in columns and not any(role in columns for role in IDENTITY_ROLES):
+            return None
+        if source.key in columns:
+            keys, unparsed = canonical_employee_keys(df[columns[source.key]])
+        else:
+            keys, unparsed = pd.Series(MISSING_KEY, index=df.index, dtype='int64'), np.zeros(len(df), dtype=bool)
+        keys, resolved = self.identity_keys(df, columns, keys)
+        if source.key in columns:
+            self.record_unparsed_keys(source.label, df[columns[source.key]], unparsed & ~resolved)
+        amount_col = columns.get(source.amount_role) if source.amount_role else None
+        amounts = df[amount_col].to_numpy(dtype='int64') if amount_col else np.zeros(len(df), dtype='int64')
+        keyed = pd.DataFrame({'Employee_Key': keys, 'Amount': amounts})
+        return keyed[keyed['Employee_Key'] != MISSING_KEY]
+    
+    def apply_bank_payments(self, salary_df, salary_cols, salary_emp_ids, payment_frames):
+        """
+        Bank stage shared by all SOA adapters: name fallback for rows without
+        an ID, reference index update and the per-employee payment summary
+        columns. Returns the final payments (Employee_Key filled in).
+        """
+        bank_payments = (pd.concat(payment_frames, ignore_index=True) if payment_frames
+                         else pd.DataFrame({col: pd.Series([], dtype=dtype) for col, dtype in BANK_PAYMENT_DTYPES.items()}))
+        bank_payments['Match_Confidence'] = np.where(bank_payments['Employee_Key'] != MISSING_KEY, 1.0, np.nan)
+        
+        # Rows without an ID: fall back to payee name (and amount) against the salary roster
+        self.bank_name_matches = self.match_unidentified_payments(
+            bank_payments, salary_emp_ids.to_numpy(),
+            salary_df[salary_cols['employee_name']].to_numpy() if 'employee_name' in salary_cols else None,
+            salary_df[salary_cols['net_pay']].to_numpy() if 'net_pay' in salary_cols else None)
+        if not self.bank_name_matches.empty:
+            print(f"   Linked {len(self.bank_name_matches)} unidentified payments by name")
+        if self.reference_index is not None:
+            self.reference_index.upsert(bank_payments)
+        
+        # All SOA rows grouped per employee across banks
+        expected_per_employee = None
+        if 'net_pay' in salary_cols:
+            expected_per_employee = pd.Series(salary_df[salary_cols['net_pay']].to_numpy(dtype='int64'),
+                                              index=salary_emp_ids.to_numpy()).groupby(level=0).sum()
+        bank_summary = self.aggregate_bank_payments(bank_payments, expected_per_employee)
+        salary_df['Bank_Payment_Count'] = salary_emp_ids.map(bank_summary['Payment_Count']).fillna(0).astype('int64').to_numpy()
+        salary_df['Bank_Sources'] = salary_emp_ids.map(bank_summary['Banks']).to_numpy()
+        salary_df['Bank_Match_Confidence'] = salary_emp_ids.map(bank_summary['Match_Confidence']).to_numpy(dtype='float64')
+        salary_df['Bank_Transaction_IDs'] = salary_emp_ids.map(bank_summary['Transaction_IDs']).to_numpy()
+        salary_df['Bank_UTRs'] = salary_emp_ids.map(bank_summary['UTRs']).to_numpy()
+        pattern = salary_emp_ids.map(bank_summary['Payment_Pattern']).astype(object).fillna('Not Paid')
+        salary_df['Bank_Payment_Pattern'] = pd.Categorical(pattern.to_numpy(), categories=BANK_PAYMENT_PATTERNS)
+        pattern_counts = bank_summary['Payment_Pattern'].value_counts()
+        print("   Payments per employee: " +
+              ", ".join(f"{name} {pattern_counts.get(name, 0)}" for name in BANK_PAYMENT_PATTERNS[:-1]))
+        return bank_payments
+    
+    def process_bank_file(self, bank_df):
+        """Extract employee IDs from bank file Employee column (Name-ID format)"""
+        bank_cols = self.detect_file_columns(bank_df, 'bank')
+        employee_col = bank_cols.get('employee')
+        if not employee_col:
+            return pd.Series([], dtype='int64')
+        
+        # The number after the last '-' of "Name-ID"; values without one carry no ID
+        employee_keys, _, _ = split_employee_field(bank_df[employee_col].dropna())
+        return employee_keys[employee_keys != MISSING_KEY]
+    
+    def reconcile_six_files(self, files, period=None):
         """
         Enhanced 6-file reconciliation:
         files = {
@@ -274,36 +2041,105 @@ class EnhancedReconciliation:
             'epf': 'path/to/epf.xlsx',
             'nps': 'path/to/nps.xlsx'
         }
+        ``period`` is the salary month ('YYYY-MM'); without it the period is
+        read from RMS export file names, and cross-window matching is off
+        when they don't name one.
         """
         
         print("🚀 Starting Enhanced 6-File Reconciliation Process...")
+        if self.parse_cache is not None:
+            self.parse_cache.reset_stats()
+        self.run_period = pd.Period(period, freq='M').strftime('%Y-%m') if period else self.salary_period(files)
+        if self.carry_forward is not None and not self.run_period:
+            print("⚠️ Salary period unknown - pass period='YYYY-MM' to match payments across SOA windows")
         
-        # Load all files
-        data = {}
-        for file_type, file_path in files.items():
-            if file_path and os.path.exists(file_path):
-                print(f"📁 Loading {file_type} file...")
-                data[file_type] = self.read_file_smart(file_path, file_type)
-            else:
-                print(f"⚠️ {file_type} file not found: {file_path}")
-                data[file_type] = None
+        # Same salary file and settings as the last run: only re-match what changed
+        digests = self.input_digests(files) if self.run_state is not None else {}
+        if self.run_state is not None and self.run_state.usable(self.state_settings(), digests.get('salary')):
+            return self.reconcile_changed_sources(files, digests)
+        
+        # Load all files in parallel; columns are detected as each one arrives
+        data, detected_columns = self.load_sources(files)
         
         # Main salary dataframe
         salary_df = data['salary']
         if salary_df is None:
             raise Exception("Salary file is required for reconciliation")
         
-        # Detect columns
-        salary_cols = self.detect_file_columns(salary_df, 'salary')
+        salary_cols = detected_columns['salary']
+        self.prepare_salary(salary_df, salary_cols)
+        
+        # Get employee IDs from salary
+        if 'employee_id' not in salary_cols:
+            print("❌ Employee ID column not found in salary data")
+            return None, pd.DataFrame(columns=DISCREPANCY_COLUMNS), {}
+        self.unparsed_keys = pd.DataFrame(columns=UNPARSED_KEY_COLUMNS)
+        self.unparsed_amounts = pd.DataFrame(columns=UNPARSED_AMOUNT_COLUMNS)
+        self.record_unparsed_amounts('salary', 'Salary')
+        self.salary_keys = self.employee_keys(salary_df[salary_cols['employee_id']], 'Salary').to_numpy()
+        self.update_identity_index(salary_df, salary_cols)
+        
+        # Key every loaded source through its adapter
+        inputs = {}
+        for source in RECONCILIATION_SOURCES:
+            if data.get(source.name) is not None:
+                self.key_source(source, data[source.name], detected_columns[source.name], inputs)
         
-        # Add analysis columns
+        self.match_matrix = pd.DataFrame(index=salary_df.index)
+        result = self.match_sources(salary_df, salary_cols, inputs, list(MATCH_GROUPS))
+        self.save_run_state(digests, salary_df, salary_cols, inputs)
+        return result
+    
+    def reconcile_changed_sources(self, files, digests):
+        """
+        Rerun against the saved state: sources whose file hash is unchanged
+        keep their keyed inputs, changed ones are re-parsed and re-keyed, and
+        only their groups' matrix columns and statuses are recomputed
+        """
+        state = self.run_state
+        changed = [source for source in RECONCILIATION_SOURCES
+                   if digests.get(source.name) != state.meta['digests'].get(source.name)]
+        
+        salary_df = state.frame('salary')
+        salary_cols = state.meta['salary_columns']
+        self.salary_keys = canonical_employee_keys(salary_df[salary_cols['employee_id']])[0].to_numpy()
+        inputs = {name: {part: state.frame(f'{part}.{name}') for part in parts}
+                  for name, parts in state.meta['inputs'].items()}
+        self.match_matrix = state.frame('matrix')
+        self.bank_name_matches = state.frame('bank_name_matches')
+        self.unparsed_keys = state.frame('unparsed_keys')
+        self.unparsed_amounts = state.frame('unparsed_amounts')
+        
+        if not changed:
+            print("♻️ No source changed since the last run - reusing its results")
+        else:
+            print(f"♻️ Same salary file as the last run - re-matching {', '.join(source.name for source in changed)}")
+        
+        data, detected_columns = self.load_sources(
+            {source.name: files[source.name] for source in changed if source.name in digests})
+        changed_labels = [source.label for source in changed]
+        self.unparsed_keys = self.unparsed_keys[~self.unparsed_keys['Source'].isin(changed_labels)]
+        self.unparsed_amounts = self.unparsed_amounts[~self.unparsed_amounts['Source'].isin(changed_labels)]
+        for source in changed:
+            inputs.pop(source.name, None)
+            if data.get(source.name) is not None:
+                self.key_source(source, data[source.name], detected_columns[source.name], inputs)
+        
+        groups = [group for group in MATCH_GROUPS if any(source.group == group for source in changed)]
+        result = self.match_sources(salary_df, salary_cols, inputs, groups)
+        self.save_run_state(digests, salary_df, salary_cols, inputs)
+        return result
+    
+    def prepare_salary(self, salary_df, salary_cols):
+        """Add the Branch/Designation/Department analysis columns and Pending statuses"""
         if 'location' in salary_cols:
-            salary_df['Branch'] = salary_df[salary_cols['location']].apply(self.map_employee_to_branch)
+            salary_df['Branch'] = self._map_labels(salary_df[salary_cols['location']], self.map_employee_to_branch)
         else:
             salary_df['Branch'] = self.default_branch
         
         if 'designation' in salary_cols:
-            salary_df['Designation_Category'] = salary_df[salary_cols['designation']].apply(self.map_employee_to_designation)
+            salary_df['Designation_Category'] = self._map_labels(salary_df[salary_cols['designation']],
+                                                                 self.map_employee_to_designation)
             salary_df['Original_Designation'] = salary_df[salary_cols['designation']]
         else:
             salary_df['Designation_Category'] = self.default_designation
@@ -315,151 +2151,408 @@ class EnhancedReconciliation:
         else:
             salary_df['Department'] = 'General'
         
-        # Initialize reconciliation status columns
-        status_columns = ['Bank_Match_Status', 'TDS_Match_Status', 'EPF_Match_Status', 'NPS_Match_Status']
-        for col in status_columns:
-            salary_df[col] = 'Pending'
+        # Every group starts Pending (all fields zero)
+        salary_df[STATUS_CODE_COLUMN] = np.zeros(len(salary_df), dtype=STATUS_CODE_DTYPE)
+    
+    def key_source(self, source, df, columns, inputs):
+        """Key one loaded source through its adapter's key extractor into ``inputs``"""
+        print(f"{source.icon} Processing {source.name}...")
+        self.record_unparsed_amounts(source.name, source.label)
+        parts = source.key_extractor(self, source, df, columns)
+        if parts is not None:
+            inputs[source.name] = parts
+    
+    def match_sources(self, salary_df, salary_cols, inputs, groups):
+        """
+        Match matrix columns and packed statuses for ``groups``; the other
+        groups keep theirs. Then discrepancies and match counts for all.
+        ``inputs`` maps each keyed source to its extractor's frames; payment
+        inputs go through the bank stage before they are matched.
+        """
+        salary_emp_ids, _ = canonical_employee_keys(salary_df[salary_cols['employee_id']])
+        self.source_inputs = inputs
+        keyed = {name: parts['keyed'] for name, parts in inputs.items() if 'keyed' in parts}
+        payment_inputs = {name: parts for name, parts in inputs.items() if 'payments' in parts}
         
-        # Reconciliation tracking
-        matches = {'bank': 0, 'tds': 0, 'epf': 0, 'nps': 0}
-        discrepancies = []
+        transfer_frames = [parts['transfers'] for parts in payment_inputs.values() if 'transfers' in parts]
+        self.bulk_transfers_found = pd.concat(transfer_frames, ignore_index=True) if transfer_frames else pd.DataFrame()
+        if not self.bulk_transfers_found.empty:
+            explained = int(self.bulk_transfers_found['Explained'].sum())
+            print(f"   Bulk transfers: {len(self.bulk_transfers_found)} ({explained} fully explained by employee payments)")
+        adjacent = False
+        if 'bank' in groups and self.carry_forward is not None and self.run_period:
+            self.carry_forward.reset_run(self.run_period)
+            adjacent = not self.carry_forward.pending('Payment', self.run_period).empty
+        if 'bank' in groups and (payment_inputs or adjacent):
+            # Banks are matched together: name fallback and aggregation span every SOA
+            payment_frames = [parts['payments'].assign(_source=name) for name, parts in payment_inputs.items()]
+            payment_frames = self.split_payment_windows(payment_frames)
+            bank_payments = self.apply_bank_payments(salary_df, salary_cols, salary_emp_ids, payment_frames)
+            salary_df['Bank_Match_Window'] = self.payment_windows(salary_emp_ids, bank_payments)
+            for name, rows in bank_payments.groupby('_source', sort=False):
+                identified = rows[rows['Employee_Key'] != MISSING_KEY]
+                keyed[name] = identified[['Employee_Key', 'Amount']]
+            for name in payment_inputs:
+                # An SOA whose payments were all parked still counts as searched
+                keyed.setdefault(name, pd.DataFrame({'Employee_Key': pd.Series([], dtype='int64'),
+                                                     'Amount': pd.Series([], dtype='int64')}))
         
-        # Get employee IDs from salary
-        if 'employee_id' not in salary_cols:
-            print("❌ Employee ID column not found in salary data")
-            return None, [], {}
-        
-        salary_emp_ids = salary_df[salary_cols['employee_id']].astype(str)
-        
-        # Process Bank Files
-        bank_employee_ids = set()
-        for bank_type in ['bank_kotak', 'bank_deutsche']:
-            if data[bank_type] is not None:
-                print(f"🏦 Processing {bank_type}...")
-                bank_ids = self.process_bank_file(data[bank_type])
-                bank_employee_ids.update(bank_ids)
-                print(f"   Found {len(bank_ids)} records")
-        
-        # Match with bank
-        for idx, emp_id in enumerate(salary_emp_ids):
-            if str(emp_id) in bank_employee_ids:
-                salary_df.at[idx, 'Bank_Match_Status'] = 'Matched'
-                matches['bank'] += 1
-            else:
-                salary_df.at[idx, 'Bank_Match_Status'] = 'Not Found'
+        # One employee x source presence matrix over the normalized key space,
+        # built only for the sources of the groups being matched
+        keyed_sources = [source for source in RECONCILIATION_SOURCES if source.group in groups and source.name in keyed]
+        matrix = build_match_matrix(salary_emp_ids, [keyed[source.name]['Employee_Key'] for source in keyed_sources])
+        kept = [source.name for source in RECONCILIATION_SOURCES
+                if source.group not in groups and source.name in self.match_matrix.columns]
+        self.match_matrix = pd.concat(
+            [self.match_matrix[kept], pd.DataFrame(matrix, index=salary_df.index,
+                                                   columns=[source.name for source in keyed_sources])], axis=1)
+        self.match_matrix = self.match_matrix[[source.name for source in RECONCILIATION_SOURCES
+                                               if source.name in self.match_matrix.columns]]
         
-        # Process TDS
-        if data['tds'] is not None:
-            print("💰 Processing TDS file...")
-            tds_df = data['tds']
-            tds_cols = self.detect_file_columns(tds_df, 'tds')
-            
-            if 'employee_id' in tds_cols:
-                tds_emp_ids = set(tds_df[tds_cols['employee_id']].astype(str))
-                
-                for idx, emp_id in enumerate(salary_emp_ids):
-                    if str(emp_id) in tds_emp_ids:
-                        salary_df.at[idx, 'TDS_Match_Status'] = 'Matched'
-                        matches['tds'] += 1
-                    else:
-                        salary_df.at[idx, 'TDS_Match_Status'] = 'Not Found'
-        
-        # Process EPF
-        if data['epf'] is not None:
-            print("🏛️ Processing EPF file...")
-            epf_df = data['epf']
-            epf_cols = self.detect_file_columns(epf_df, 'epf')
-            
-            if 'employee_id' in epf_cols:
-                epf_emp_ids = set(epf_df[epf_cols['employee_id']].astype(str))
-                
-                for idx, emp_id in enumerate(salary_emp_ids):
-                    if str(emp_id) in epf_emp_ids:
-                        salary_df.at[idx, 'EPF_Match_Status'] = 'Matched'
-                        matches['epf'] += 1
-                    else:
-                        salary_df.at[idx, 'EPF_Match_Status'] = 'Not Found'
-        
-        # Process NPS
-        if data['nps'] is not None:
-            print("🏛️ Processing NPS file...")
-            nps_df = data['nps']
-            nps_cols = self.detect_file_columns(nps_df, 'nps')
-            
-            if 'employee_id' in nps_cols:
-                nps_emp_ids = set(nps_df[nps_cols['employee_id']].astype(str))
-                
-                for idx, emp_id in enumerate(salary_emp_ids):
-                    if str(emp_id) in nps_emp_ids:
-                        salary_df.at[idx, 'NPS_Match_Status'] = 'Matched'
-                        matches['nps'] += 1
-                    else:
-                        salary_df.at[idx, 'NPS_Match_Status'] = 'Not Found'
+        # Statuses per group: any source in the group, then its amount rule
+        status_codes = salary_df[STATUS_CODE_COLUMN].to_numpy()
+        for group in groups:
+            label, _ = MATCH_GROUPS[group]
+            amount_columns = [f'{label}_Amount_Status', f'{label}_Paid_Amount', f'{label}_Variance',
+                              f'{label}_Variance_Bucket']
+            members = [j for j, source in enumerate(keyed_sources) if source.group == group]
+            field = np.zeros(len(salary_df), dtype='int8')
+            match_rule = 'presence'
+            if members:
+                field = np.where(matrix[:, members].any(axis=1), 1, 2).astype('int8')
+                rule_source = keyed_sources[members[0]]
+                match_rule = rule_source.match_rule
+                if group == 'bank' and self.bank_match_mode == 'presence':
+                    match_rule = 'presence'
+                if match_rule == 'amount' and rule_source.expected_role not in salary_cols:
+                    print(f"⚠️ {rule_source.expected_role} column not found in salary data - matching {label} by employee only")
+                    match_rule = 'presence'
+            if match_rule == 'amount':
+                group_rows = pd.concat([keyed[keyed_sources[j].name] for j in members], ignore_index=True)
+                paid_per_employee = group_rows.groupby('Employee_Key', sort=False)['Amount'].sum()
+                expected = salary_df[salary_cols[rule_source.expected_role]]
+                if group == 'bank' and self.carry_forward is not None and self.run_period:
+                    amount_status, paid, variance = self.apply_carry_forward(
+                        salary_df, salary_emp_ids, expected, paid_per_employee)
+                else:
+                    amount_status, paid, variance = self.match_amounts(salary_emp_ids, expected, paid_per_employee)
+                buckets = self.variance_buckets(amount_status, variance)
+                for col, values in zip(amount_columns, (amount_status, paid, variance, buckets)):
+                    salary_df[col] = values
+                mismatch = amount_status.isin(['Short Paid', 'Over Paid']).to_numpy()
+                field[mismatch] = MATCH_STATUSES.index('Amount Mismatch')
+                counts = amount_status.value_counts()
+                print(f"   {label} amounts (±₹{paise_to_rupees(self.tolerance_paise):g}): " +
+                      ", ".join(f"{status} {counts.get(status, 0)}" for status in AMOUNT_STATUSES))
+                bands = buckets.value_counts()
+                sized = [band for band in VARIANCE_BUCKETS[2:-1] if bands.get(band, 0)]
+                if sized:
+                    print(f"   {label} variances: " + ", ".join(f"{band} {bands[band]}" for band in sized))
+            else:
+                # A source dropped since the last run leaves no stale amount columns behind
+                salary_df.drop(columns=[col for col in amount_columns if col in salary_df.columns], inplace=True)
+            status_codes = pack_status_field(status_codes, group, field)
+        salary_df[STATUS_CODE_COLUMN] = status_codes
+        matches = self.match_counts(salary_df)
         
         # Create comprehensive discrepancies
-        for idx, row in salary_df.iterrows():
-            issues = []
-            if row['Bank_Match_Status'] == 'Not Found':
-                issues.append('Bank SOA')
-            if row['TDS_Match_Status'] == 'Not Found':
-                issues.append('TDS')
-            if row['EPF_Match_Status'] == 'Not Found':
-                issues.append('EPF')
-            if row['NPS_Match_Status'] == 'Not Found':
-                issues.append('NPS')
-            
-            if issues:
-                discrepancies.append({
-                    'Employee_ID': row.get(salary_cols['employee_id'], ''),
-                    'Employee_Name': row.get(salary_cols.get('employee_name', ''), ''),
-                    'Branch': row.get('Branch', 'Delhi'),
-                    'Department': row.get('Department', 'General'),
-                    'Designation': row.get('Designation_Category', 'Other Staff'),
-                    'Missing_From': ', '.join(issues),
-                    'Bank_Status': row['Bank_Match_Status'],
-                    'TDS_Status': row['TDS_Match_Status'],
-                    'EPF_Status': row['EPF_Match_Status'],
-                    'NPS_Status': row['NPS_Match_Status'],
-                    'Basic_Salary': row.get(salary_cols.get('basic_salary', ''), 0)
-                })
+        discrepancies = self.build_discrepancies(salary_df, salary_cols)
         
         total_employees = len(salary_df)
-        print(f"\n✅ 6-File Reconciliation Completed!")
+        print("\n✅ 6-File Reconciliation Completed!")
         print(f"📊 Total Employees: {total_employees}")
-        print(f"🏦 Bank Matches: {matches['bank']}")
-        print(f"💰 TDS Matches: {matches['tds']}")
-        print(f"🏛️ EPF Matches: {matches['epf']}")
-        print(f"🏛️ NPS Matches: {matches['nps']}")
+        for group, (label, _) in MATCH_GROUPS.items():
+            icon = next((source.icon for source in RECONCILIATION_SOURCES if source.group == group), '📄')
+            print(f"{icon} {label} Matches: {matches[group]}")
         print(f"❌ Total Discrepancies: {len(discrepancies)}")
+        if not self.unparsed_keys.empty:
+            counts = self.unparsed_keys['Source'].value_counts()
+            print("⚠️ Unparsed employee IDs: " + ", ".join(f"{source} {count}" for source, count in counts.items()))
+        if not self.unparsed_amounts.empty:
+            counts = self.unparsed_amounts['Source'].value_counts()
+            print("⚠️ Unparsed amounts (counted as ₹0): " +
+                  ", ".join(f"{source} {count}" for source, count in counts.items()))
+        if self.parse_cache is not None and self.parse_cache.hits + self.parse_cache.misses:
+            cache_stats = self.parse_cache.stats()
+            print(f"⚡ Parse cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
         
         return salary_df, discrepancies, matches
     
+    def salary_period(self, files):
+        """'YYYY-MM' salary period of a run, from its export file names"""
+        for file_type in SOURCE_TYPES:
+            classified = classify_source_file(files.get(file_type) or '')
+            if classified:
+                return classified[1]
+        return None
+    
+    def split_payment_windows(self, payment_frames):
+        """
+        Attribute every SOA payment to a salary period by its date (salary is
+        paid the month after). Payments dated for another period are parked in
+        the carry-forward ledger, and payments parked for this period by
+        earlier runs join as 'Adjacent Window'. Each frame gets a Bank_Window.
+        """
+        period, ledger = self.run_period, self.carry_forward
+        current, parked, skipped = [], [], 0
+        for frame in payment_frames:
+            dates = frame['Date']
+            elsewhere = np.zeros(len(frame), dtype=bool)
+            if ledger is not None and period:
+                attributed = (dates.dt.to_period('M') - 1).astype(str)
+                elsewhere = dates.notna().to_numpy() & (attributed != period).to_numpy()
+                identified = (frame['Employee_Key'] != MISSING_KEY).to_numpy()
+                away = frame[elsewhere & identified]
+                skipped += int((elsewhere & ~identified).sum())
+                if not away.empty:
+                    parked.append(pd.DataFrame({
+                        'Kind': 'Payment', 'Period': attributed[elsewhere & identified].to_numpy(),
+                        'Employee_Key': away['Employee_Key'].to_numpy(), 'Amount': away['Amount'].to_numpy(),
+                        'Source': away['_source'].to_numpy(), 'Bank_Source': away['Bank_Source'].to_numpy(),
+                        'Transaction_ID': away['Transaction_ID'].to_numpy(), 'Date': away['Date'].to_numpy(),
+                        'Recorded_In': period}))
+            keep = frame[~elsewhere]
+            late = keep['Date'].dt.day.gt(BANK_WINDOW_END_DAY).to_numpy(dtype=bool, na_value=False)
+            current.append(keep.assign(Bank_Window=np.where(late, 'Late', 'Current')))
+        
+        if ledger is None or not period:
+            return current
+        if parked:
+            parked = pd.concat(parked, ignore_index=True)
+            ledger.add(parked)
+            print(f"   Parked {len(parked)} payments dated for other salary periods" +
+                  (f" ({skipped} without an employee ID dropped)" if skipped else ""))
+        adjacent = ledger.pending('Payment', period)
+        if not adjacent.empty:
+            ledger.resolve(adjacent.index, period)
+            rows = adjacent.reindex(columns=list(BANK_PAYMENT_DTYPES)).astype(BANK_PAYMENT_DTYPES)
+            current.append(rows.assign(_source=adjacent['Source'].to_numpy(), Bank_Window='Adjacent Window'))
+            print(f"   Picked up {len(adjacent)} payments for {period} from adjacent SOA windows")
+        ledger.save()
+        return current
+    
+    def payment_windows(self, salary_emp_ids, bank_payments):
+        """Bank_Match_Window per salary row: the furthest window any of its payments came from"""
+        identified = bank_payments[bank_payments['Employee_Key'] != MISSING_KEY]
+        ranks = pd.Categorical(identified['Bank_Window'], categories=BANK_MATCH_WINDOWS).codes
+        per_key = pd.Series(ranks, index=identified['Employee_Key'].to_numpy()).groupby(level=0).max()
+        codes = salary_emp_ids.map(per_key).fillna(BANK_MATCH_WINDOWS.index('Not Paid')).to_numpy(dtype='int8')
+        return pd.Categorical.from_codes(codes, BANK_MATCH_WINDOWS)
+    
+    def apply_carry_forward(self, salary_df, salary_emp_ids, expected, paid_per_employee):
+        """
+        Bank amount matching across periods: this period's surplus per
+        employee first settles their open items from earlier periods (oldest
+        first, whole items only), settled arrears count as expected, and
+        whatever is still owed is recorded as an open item for later runs.
+        Returns match_amounts' (amount status, paid, variance).
+        """
+        ledger, period = self.carry_forward, self.run_period
+        expected = np.asarray(expected, dtype='int64')
+        expected_per_key = pd.Series(expected, index=salary_emp_ids.to_numpy()).groupby(level=0).sum()
+        surplus = paid_per_employee - expected_per_key.reindex(paid_per_employee.index).fillna(0).astype('int64')
+        surplus = surplus[surplus > self.tolerance_paise]
+        
+        settled = pd.Series(dtype='int64')
+        items = ledger.pending('Open Item', period, before=True)
+        items = items[items['Employee_Key'].isin(surplus.index)].sort_values('Period', kind='stable')
+        if not items.empty:
+            owed = items.groupby('Employee_Key', sort=False)['Amount'].cumsum().to_numpy()
+            covered = owed <= items['Employee_Key'].map(surplus).to_numpy(dtype='int64') + self.tolerance_paise
+            ledger.resolve(items.index[covered], period)
+            settled = items[covered].groupby('Employee_Key')['Amount'].sum()
+            if covered.any():
+                print(f"   Carried forward: {int(covered.sum())} open items from earlier periods settled")
+        
+        settled_rows = salary_emp_ids.map(settled).fillna(0).to_numpy(dtype='int64')
+        amount_status, paid, variance = self.match_amounts(salary_emp_ids, expected + settled_rows, paid_per_employee)
+        if settled_rows.any():
+            windows = salary_df['Bank_Match_Window'].to_numpy(copy=True)
+            windows[settled_rows > 0] = 'Carried Forward'
+            salary_df['Bank_Match_Window'] = pd.Categorical(windows, categories=BANK_MATCH_WINDOWS)
+        
+        # Still owed for this period: rolls forward to the next run
+        owed = np.select([amount_status.eq('Missing').to_numpy(), amount_status.eq('Short Paid').to_numpy()],
+                         [expected, -variance.to_numpy()], default=0)
+        open_rows = (owed > 0) & (salary_emp_ids != MISSING_KEY).to_numpy()
+        ledger.add(pd.DataFrame({'Kind': 'Open Item', 'Period': period,
+                                 'Employee_Key': salary_emp_ids.to_numpy()[open_rows],
+                                 'Amount': owed[open_rows], 'Recorded_In': period}))
+        ledger.save()
+        return amount_status, paid, variance
+    
+    def carry_forward_report(self):
+        """Ledger items this run recorded or settled, plus everything still open"""
+        ledger, period = self.carry_forward, self.run_period
+        if ledger is None or not period:
+            return pd.DataFrame()
+        frame = ledger.frame
+        still_open = (frame['Kind'] == 'Open Item') & frame['Resolved_In'].isna() & (frame['Period'] <= period)
+        rows = frame[(frame['Recorded_In'] == period) | (frame['Resolved_In'] == period) | still_open]
+        return rows.assign(Status=np.where(rows['Resolved_In'].notna(), 'Resolved', 'Open'))
+    
+    def input_digests(self, files):
+        """Content hash of every input file that exists"""
+        return {file_type: file_digest(file_path)[0] for file_type, file_path in files.items()
+                if file_path and os.path.exists(file_path)}
+    
+    def state_settings(self):
+        """Everything besides the inputs that a saved run's results depend on"""
+        return {
+            'version': RUN_STATE_VERSION,
+            'parser': PARSER_VERSION,
+            'period': self.run_period,
+            'sources': [source.name for source in RECONCILIATION_SOURCES],
+            'variants': {file_type: self._cache_variant(file_type) for file_type in SOURCE_TYPES},
+            'tolerance_paise': int(self.tolerance_paise),
+            'bank_match_mode': self.bank_match_mode,
+            'name_match_threshold': self.name_match_threshold
+        }
+    
+    def save_run_state(self, digests, salary_df, salary_cols, inputs):
+        """Persist this run's normalized inputs for the next incremental rerun"""
+        if self.run_state is None:
+            return
+        frames = {'salary': salary_df, 'matrix': self.match_matrix, 'bank_name_matches': self.bank_name_matches,
+                  'unparsed_keys': self.unparsed_keys.astype({'Source': TEXT_DTYPE, 'Row': 'int64', 'Value': TEXT_DTYPE}),
+                  'unparsed_amounts': self.unparsed_amounts.astype({'Source': TEXT_DTYPE, 'Row': 'int64',
+                                                                    'Column': TEXT_DTYPE, 'Value': TEXT_DTYPE})}
+        frames.update({f'{part}.{name}': df for name, parts in inputs.items() for part, df in parts.items()})
+        self.run_state.save({'settings': self.state_settings(), 'digests': digests, 'salary_columns': salary_cols,
+                             'inputs': {name: list(parts) for name, parts in inputs.items()}}, frames)
+    
+    def build_discrepancies(self, salary_df, salary_cols):
+        """
+        Discrepancies_Detail frame for every employee missing from any source,
+        built from the status masks without touching rows one at a time
+        """
+        # One bit per issue; Missing_From is looked up from the bit pattern
+        issue_bits = np.zeros(len(salary_df), dtype='int64')
+        status_codes = salary_df[STATUS_CODE_COLUMN].to_numpy()
+        for bit, (source, status, _) in enumerate(DISCREPANCY_ISSUES):
+            if source in MATCH_GROUPS:
+                hit = status_field(status_codes, source) == MATCH_STATUSES.index(status)
+            elif source in salary_df.columns:
+                hit = (salary_df[source] == status).to_numpy(dtype=bool, na_value=False)
+            else:
+                continue
+            issue_bits |= hit.astype('int64') << bit
+        missing_labels = np.array([', '.join(label for bit, (_, _, label) in enumerate(DISCREPANCY_ISSUES)
+                                             if pattern >> bit & 1)
+                                   for pattern in range(1 << len(DISCREPANCY_ISSUES))], dtype=object)
+        
+        has_issue = issue_bits > 0
+        flagged = salary_df[has_issue]
+        
+        def column_or(role, default):
+            col = salary_cols.get(role)
+            if col in flagged.columns:
+                return flagged[col].to_numpy()
+            return np.full(len(flagged), default, dtype=object)
+        
+        discrepancies = pd.DataFrame({
+            'Employee_ID': column_or('employee_id', ''),
+            'Employee_Name': column_or('employee_name', ''),
+            'Branch': flagged['Branch'].to_numpy(),
+            'Department': flagged['Department'].to_numpy(),
+            'Designation': flagged['Designation_Category'].to_numpy(),
+            'Missing_From': missing_labels[issue_bits[has_issue]]
+        })
+        for group, report_col in DISCREPANCY_STATUS_COLUMNS:
+            discrepancies[report_col] = status_labels(status_field(status_codes[has_issue], group))
+        discrepancies['Basic_Salary'] = column_or('basic_salary', 0)
+        return discrepancies
+    
+    def match_counts(self, salary_df):
+        """Employees per group whose packed status is Matched"""
+        status_codes = salary_df[STATUS_CODE_COLUMN].to_numpy()
+        matched = MATCH_STATUSES.index('Matched')
+        return {group: int(np.bincount(status_field(status_codes, group), minlength=len(MATCH_STATUSES))[matched])
+                for group in MATCH_GROUPS}
+    
+    def decode_match_status(self, df):
+        """Replace the packed status code with one '<label>_Match_Status' column per group"""
+        if STATUS_CODE_COLUMN not in df.columns:
+            return df
+        position = df.columns.get_loc(STATUS_CODE_COLUMN)
+        status_codes = df.pop(STATUS_CODE_COLUMN).to_numpy()
+        for offset, (group, (label, _)) in enumerate(MATCH_GROUPS.items()):
+            df.insert(position + offset, f'{label}_Match_Status', status_labels(status_field(status_codes, group), df.index))
+        return df
+    
+    def status_summary(self, salary_df, by, name):
+        """
+        Employee count, salary total and per-group match counts for each value
+        of ``by``, counted with bincount over the packed status codes
+        """
+        salary_col = self._summary_amount_column(salary_df)
+        group_ids, labels = pd.factorize(salary_df[by], sort=True)
+        known = group_ids >= 0
+        group_ids = group_ids[known]
+        size = len(labels)
+        
+        amounts = pd.to_numeric(salary_df[salary_col], errors='coerce')[known]
+        has_amount = amounts.notna().to_numpy()
+        summary = pd.DataFrame({
+            name: np.asarray(labels),
+            'Total_Employees': np.bincount(group_ids, weights=has_amount, minlength=size).astype('int64'),
+            'Total_Salary': np.bincount(group_ids, weights=amounts.fillna(0).to_numpy(dtype='float64'), minlength=size)
+        })
+        if salary_col in self.amount_columns(salary_df, 'salary'):
+            summary['Total_Salary'] = paise_to_rupees(summary['Total_Salary'])
+        
+        status_codes = salary_df[STATUS_CODE_COLUMN].to_numpy()[known]
+        matched = MATCH_STATUSES.index('Matched')
+        for group, (label, _) in MATCH_GROUPS.items():
+            summary[f'{label}_Matched'] = np.bincount(group_ids, weights=status_field(status_codes, group) == matched,
+                                                      minlength=size).astype('int64')
+        return summary
+    
+    def variance_summary(self, salary_df, group, by='Branch', name='Branch'):
+        """
+        Amount check of one group per value of ``by``: employees per variance
+        band, short/over counts and salary vs source totals (₹) for the
+        employees the source lists, counted with bincount
+        """
+        label, _ = MATCH_GROUPS[group]
+        bucket_col = f'{label}_Variance_Bucket'
+        if bucket_col not in salary_df.columns:
+            return pd.DataFrame()
+        group_ids, labels = pd.factorize(salary_df[by], sort=True)
+        known = group_ids >= 0
+        group_ids = group_ids[known]
+        size = len(labels)
+        
+        buckets = salary_df[bucket_col].cat.codes.to_numpy()[known].astype('int64')
+        status = salary_df[f'{label}_Amount_Status'].cat.codes.to_numpy()[known]
+        paid = salary_df[f'{label}_Paid_Amount'].to_numpy(dtype='int64')[known]
+        variance = salary_df[f'{label}_Variance'].to_numpy(dtype='int64')[known]
+        listed = buckets != VARIANCE_BUCKETS.index('Missing')
+        
+        summary = pd.DataFrame({name: np.asarray(labels), 'Total_Employees': np.bincount(group_ids, minlength=size)})
+        band_counts = np.bincount(group_ids * len(VARIANCE_BUCKETS) + buckets,
+                                  minlength=size * len(VARIANCE_BUCKETS)).reshape(size, len(VARIANCE_BUCKETS))
+        for j, bucket in enumerate(VARIANCE_BUCKETS):
+            summary[bucket] = band_counts[:, j]
+        for status_name in ('Short Paid', 'Over Paid'):
+            summary[status_name.replace(' ', '_')] = np.bincount(
+                group_ids, weights=status == AMOUNT_STATUSES.index(status_name), minlength=size).astype('int64')
+        
+        total = lambda values: paise_to_rupees(np.bincount(group_ids, weights=values, minlength=size)).round(2)
+        summary[f'Salary_{label}'] = total(np.where(listed, paid - variance, 0))
+        summary[f'{label}_Reported'] = total(paid)
+        summary['Net_Variance'] = total(variance)
+        summary['Absolute_Variance'] = total(np.abs(variance))
+        return summary
+    
     def generate_branch_summary(self, salary_df):
         """Generate branch-wise summary"""
         try:
-            # Find salary column
-            salary_col = 'Basic'
-            for col in salary_df.columns:
-                col_lower = str(col).lower()
-                if any(term in col_lower for term in ['basic', 'salary', 'amount']):
-                    salary_col = col
-                    break
-            
-            summary = salary_df.groupby('Branch').agg({
-                salary_col: ['count', 'sum'],
-                'Bank_Match_Status': lambda x: (x == 'Matched').sum(),
-                'TDS_Match_Status': lambda x: (x == 'Matched').sum(),
-                'EPF_Match_Status': lambda x: (x == 'Matched').sum(),
-                'NPS_Match_Status': lambda x: (x == 'Matched').sum()
-            }).reset_index()
-            
-            summary.columns = ['Branch', 'Total_Employees', 'Total_Salary', 'Bank_Matched', 'TDS_Matched', 'EPF_Matched', 'NPS_Matched']
+            summary = self.status_summary(salary_df, 'Branch', 'Branch')
             
             # Calculate match rates
-            summary['Bank_Match_Rate_%'] = round((summary['Bank_Matched'] / summary['Total_Employees']) * 100, 2)
-            summary['TDS_Match_Rate_%'] = round((summary['TDS_Matched'] / summary['Total_Employees']) * 100, 2)
-            summary['EPF_Match_Rate_%'] = round((summary['EPF_Matched'] / summary['Total_Employees']) * 100, 2)
-            summary['NPS_Match_Rate_%'] = round((summary['NPS_Matched'] / summary['Total_Employees']) * 100, 2)
+            for label, _ in MATCH_GROUPS.values():
+                summary[f'{label}_Match_Rate_%'] = round((summary[f'{label}_Matched'] / summary['Total_Employees']) * 100, 2)
             
             return summary
             
@@ -470,25 +2563,8 @@ class EnhancedReconciliation:
     def generate_designation_summary(self, salary_df):
         """Generate designation-wise summary"""
         try:
-            # Find salary column
-            salary_col = 'Basic'
-            for col in salary_df.columns:
-                col_lower = str(col).lower()
-                if any(term in col_lower for term in ['basic', 'salary', 'amount']):
-                    salary_col = col
-                    break
-            
-            summary = salary_df.groupby('Designation_Category').agg({
-                salary_col: ['count', 'sum', 'mean'],
-                'Bank_Match_Status': lambda x: (x == 'Matched').sum(),
-                'TDS_Match_Status': lambda x: (x == 'Matched').sum(),
-                'EPF_Match_Status': lambda x: (x == 'Matched').sum(),
-                'NPS_Match_Status': lambda x: (x == 'Matched').sum()
-            }).reset_index()
-            
-            summary.columns = ['Designation', 'Total_Employees', 'Total_Salary', 'Avg_Salary', 'Bank_Matched', 'TDS_Matched', 'EPF_Matched', 'NPS_Matched']
-            
-            # Round numeric columns
+            summary = self.status_summary(salary_df, 'Designation_Category', 'Designation')
+            summary.insert(3, 'Avg_Salary', summary['Total_Salary'] / summary['Total_Employees'])
             for col in ['Total_Salary', 'Avg_Salary']:
                 summary[col] = round(summary[col], 2)
             
@@ -501,25 +2577,8 @@ class EnhancedReconciliation:
     def generate_department_summary(self, salary_df):
         """Generate department-wise summary"""
         try:
-            # Find salary column
-            salary_col = 'Basic'
-            for col in salary_df.columns:
-                col_lower = str(col).lower()
-                if any(term in col_lower for term in ['basic', 'salary', 'amount']):
-                    salary_col = col
-                    break
-            
-            summary = salary_df.groupby('Department').agg({
-                salary_col: ['count', 'sum', 'mean'],
-                'Bank_Match_Status': lambda x: (x == 'Matched').sum(),
-                'TDS_Match_Status': lambda x: (x == 'Matched').sum(),
-                'EPF_Match_Status': lambda x: (x == 'Matched').sum(),
-                'NPS_Match_Status': lambda x: (x == 'Matched').sum()
-            }).reset_index()
-            
-            summary.columns = ['Department', 'Total_Employees', 'Total_Salary', 'Avg_Salary', 'Bank_Matched', 'TDS_Matched', 'EPF_Matched', 'NPS_Matched']
-            
-            # Round numeric columns
+            summary = self.status_summary(salary_df, 'Department', 'Department')
+            summary.insert(3, 'Avg_Salary', summary['Total_Salary'] / summary['Total_Employees'])
             for col in ['Total_Salary', 'Avg_Salary']:
                 summary[col] = round(summary[col], 2)
             
@@ -529,11 +2588,11 @@ class EnhancedReconciliation:
             print(f"⚠️ Error in department summary: {e}")
             return pd.DataFrame()
     
-    def generate_comprehensive_report(self, files, output_prefix="Complete_Salary_Reconciliation"):
+    def generate_comprehensive_report(self, files, output_prefix="Complete_Salary_Reconciliation", period=None):
         """Generate comprehensive 6-file reconciliation report"""
         
         # Perform 6-file reconciliation
-        salary_df, discrepancies, matches = self.reconcile_six_files(files)
+        salary_df, discrepancies, matches = self.reconcile_six_files(files, period)
         
         if salary_df is None:
             raise Exception("Reconciliation failed - salary data could not be processed")
@@ -542,17 +2601,26 @@ class EnhancedReconciliation:
         branch_summary = self.generate_branch_summary(salary_df)
         designation_summary = self.generate_designation_summary(salary_df)
         department_summary = self.generate_department_summary(salary_df)
+        variance_summaries = {}
+        for group in MATCH_GROUPS:
+            try:
+                variance_summaries[group] = self.variance_summary(salary_df, group)
+            except Exception as e:
+                print(f"⚠️ Error in {MATCH_GROUPS[group][0]} variance summary: {e}")
         
         # Create output filename with timestamp
         timestamp = datetime.now().strftime('%B_%Y')
         output_file = f"{output_prefix}_{timestamp}.xlsx"
         
-        print(f"📝 Generating comprehensive Excel report...")
+        print("📝 Generating comprehensive Excel report...")
         
         # Create Excel file with multiple tabs
         with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
             # Tab 1: Complete salary data with all reconciliation status
-            salary_df.to_excel(writer, sheet_name='Complete_Salary_Data', index=False)
+            salary_paise_columns = self.amount_columns(salary_df, 'salary') + [
+                f'{label}_{suffix}' for label, _ in MATCH_GROUPS.values() for suffix in ('Paid_Amount', 'Variance')]
+            self.decode_match_status(self.to_report_frame(salary_df, salary_paise_columns)).to_excel(
+                writer, sheet_name='Complete_Salary_Data', index=False)
             
             # Tab 2: Branch Summary
             if not branch_summary.empty:
@@ -566,9 +2634,39 @@ class EnhancedReconciliation:
             if not department_summary.empty:
                 department_summary.to_excel(writer, sheet_name='Department_Analysis', index=False)
             
+            # Amount variances per branch, banded by size, for each amount-checked group
+            for group, summary in variance_summaries.items():
+                if not summary.empty:
+                    summary.to_excel(writer, sheet_name=f'{MATCH_GROUPS[group][0]}_Variance_By_Branch', index=False)
+            
             # Tab 5: Discrepancies
-            if discrepancies:
-                pd.DataFrame(discrepancies).to_excel(writer, sheet_name='Discrepancies_Detail', index=False)
+            if not discrepancies.empty:
+                self.to_report_frame(discrepancies, ['Basic_Salary']).to_excel(
+                    writer, sheet_name='Discrepancies_Detail', index=False)
+            
+            # Bank rows linked by payee name rather than employee ID, for review
+            if not self.bank_name_matches.empty:
+                self.to_report_frame(self.bank_name_matches, ['Amount']).to_excel(
+                    writer, sheet_name='Bank_Name_Matches', index=False)
+            
+            # Cross-window payments and salary still owed, carried between runs
+            carry_forward = self.carry_forward_report()
+            if not carry_forward.empty:
+                self.to_report_frame(carry_forward, ['Amount']).to_excel(
+                    writer, sheet_name='Carry_Forward', index=False)
+            
+            # Employee IDs no source key could be parsed from
+            if not self.unparsed_keys.empty:
+                self.unparsed_keys.to_excel(writer, sheet_name='Unparsed_Keys', index=False)
+            
+            # Amounts that did not parse and were counted as 0
+            if not self.unparsed_amounts.empty:
+                self.unparsed_amounts.to_excel(writer, sheet_name='Unparsed_Amounts', index=False)
+            
+            # Bulk uploads and the employee payments that explain them
+            if not self.bulk_transfers_found.empty:
+                self.to_report_frame(self.bulk_transfers_found, ['Amount', 'Child_Amount']).to_excel(
+                    writer, sheet_name='Bulk_Transfers', index=False)
             
             # Tab 6: Overall Summary
             total_employees = len(salary_df)
@@ -602,7 +2700,7 @@ class EnhancedReconciliation:
                     f"{round((matches.get('tds', 0)/total_employees)*100, 2)}%",
                     f"{round((matches.get('epf', 0)/total_employees)*100, 2)}%",
                     f"{round((matches.get('nps', 0)/total_employees)*100, 2)}%",
-                    f"{round(sum(matches.values())/(total_employees*4)*100, 2)}%",
+                    f"{round(sum(matches.values())/(total_employees*len(MATCH_GROUPS))*100, 2)}%",
                     len(branch_summary) if not branch_summary.empty else 0,
                     len(department_summary) if not department_summary.empty else 0,
                     datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -611,7 +2709,7 @@ class EnhancedReconciliation:
             
             pd.DataFrame(summary_data).to_excel(writer, sheet_name='Executive_Summary', index=False)
         
-        print(f"\n✅ Comprehensive 6-File Reconciliation Report Generated!")
+        print("\n✅ Comprehensive 6-File Reconciliation Report Generated!")
         print(f"📄 Report saved: {output_file}")
         
         return output_file, {
@@ -620,13 +2718,14 @@ class EnhancedReconciliation:
             'discrepancies': total_discrepancies,
             'branch_summary': branch_summary,
             'designation_summary': designation_summary,
-            'department_summary': department_summary
+            'department_summary': department_summary,
+            'variance_summaries': {group: summary for group, summary in variance_summaries.items() if not summary.empty}
         }
 
 # Main functions for compatibility
 def main():
     """Main function for standalone execution"""
-    reconciler = EnhancedReconciliation()
+    reconciler = EnhancedReconciliation(state_dir=STATE_DIR)
     
     # Example file configuration for testing
     files = {
@@ -666,10 +2765,11 @@ def perform_reconciliation():
 def run_reconciliation():
     return main()
 
-def reconcile_with_files(files):
-    """Reconcile with specific files"""
-    reconciler = EnhancedReconciliation()
-    return reconciler.generate_comprehensive_report(files)
+def reconcile_with_files(files, tolerance_amount=1.0, bank_match_mode='amount', period=None):
+    """Reconcile with specific files (``period``: salary month 'YYYY-MM')"""
+    reconciler = EnhancedReconciliation(tolerance_amount=tolerance_amount, bank_match_mode=bank_match_mode,
+                                        state_dir=STATE_DIR)
+    return reconciler.generate_comprehensive_report(files, period=period)
 
 if __name__ == "__main__":
     main()
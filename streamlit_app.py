@@ -17,7 +17,7 @@ from openpyxl.utils.dataframe import dataframe_to_rows
 try:
     from salary_reconciliation_agent import reconcile_with_files
 except:
-    def reconcile_with_files(files):
+    def reconcile_with_files(files, **options):
         st.error("Enhanced reconciliation module not found")
         return None, {}
 
@@ -767,6 +767,9 @@ def show_manual_reconciliation():
     col1, col2 = st.columns(2)
     
     with col1:
+        # Uploaded file names don't say which month they are for; default to last month
+        salary_periods = pd.period_range(end=pd.Period(datetime.now(), freq='M') - 1, periods=12, freq='M')[::-1]
+        salary_period = st.selectbox("📅 Salary Month", list(salary_periods), format_func=lambda p: p.strftime('%B %Y'))
         tolerance_amount = st.number_input("💰 Amount Tolerance (₹)", min_value=0.0, value=1.0, step=0.1)
         include_inactive = st.checkbox("👥 Include inactive employees", value=False)
         detailed_analysis = st.checkbox("📊 Generate detailed analysis", value=True)
@@ -804,33 +807,35 @@ def show_manual_reconciliation():
             status_text = st.empty()
             
             try:
-                # Simulate processing steps
-                for i, step in enumerate([
-                    "📁 Loading uploaded files...",
-                    "🔄 Processing salary data...", 
-                    "🏦 Reconciling bank transactions...",
-                    "💰 Processing TDS data...",
-                    "🏛️ Processing EPF/NPS data...",
-                    "📊 Generating comprehensive report...",
-                    "✅ Finalizing reconciliation..."
-                ]):
-                    progress_bar.progress((i + 1) * 14)
-                    status_text.text(step)
+                status_text.text("🔄 Reconciling salary, TDS, bank and EPF/NPS files...")
+                progress_bar.progress(10)
+                # Bank net pay is matched within the tolerance chosen above
+                output_file, summary = reconcile_with_files(temp_files, tolerance_amount=tolerance_amount,
+                                                            period=salary_period.strftime('%Y-%m'))
+                progress_bar.progress(100)
+                status_text.text("✅ Finalizing reconciliation...")
+                if not output_file:
+                    raise Exception("no report was produced")
                 
                 st.success("✅ Manual reconciliation completed successfully!")
                 
                 # Show results summary
+                total_employees = summary.get('total_employees', 0)
+                bank_matches = summary.get('matches', {}).get('bank', 0)
+                discrepancies = summary.get('discrepancies', 0)
+                rate = lambda count: f"{round(count / total_employees * 100, 1) if total_employees else 0}%"
                 col1, col2, col3 = st.columns(3)
                 with col1:
-                    st.metric("👥 Total Employees", "547")
+                    st.metric("👥 Total Employees", f"{total_employees}")
                 with col2:
-                    st.metric("✅ Matched Records", "521 (95.2%)")
+                    st.metric("✅ Bank Matches", f"{bank_matches} ({rate(bank_matches)})")
                 with col3:
-                    st.metric("❌ Discrepancies", "26 (4.8%)")
+                    st.metric("❌ Discrepancies", f"{discrepancies} ({rate(discrepancies)})")
                 
                 # FIXED EXCEL EXPORT
                 try:
-                    excel_data = create_proper_excel_report({})
+                    with open(output_file, "rb") as report:
+                        excel_data = report.read()
                     
                     if excel_data:
                         st.download_button(
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def write_source(tmp_path):
+    """Write ``{column: values}`` as a CSV export under tmp_path and return its path"""
+    def write(file_name, columns):
+        path = tmp_path / file_name
+        pd.DataFrame(columns).to_csv(path, index=False)
+        return str(path)
+    return write
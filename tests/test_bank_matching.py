@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+
+from salary_reconciliation_agent import AMOUNT_STATUSES, PARQUET_AVAILABLE, EnhancedReconciliation
+
+EMPLOYEES = {
+    'EmpCode': [101, 102, 103, 104],
+    'EmployeeName': ['Asha Rao', 'Vikram Singh', 'Neha Gupta', 'Rahul Jain'],
+    'Department': ['Sales'] * 4,
+    'Designation': ['Executive'] * 4,
+    'BaseLocation': ['Delhi'] * 4,
+    'ClubNetpayable': [50000, 40000, 30000, 20000]
+}
+
+
+def bank_soa(payments):
+    """Kotak-style SOA columns for (employee field, date, amount) payments"""
+    return {
+        'TransactionID': list(range(1, len(payments) + 1)),
+        'GroupId': [0] * len(payments),
+        'Employee': [employee for employee, _, _ in payments],
+        'Type': ['Payment'] * len(payments),
+        'Date': [date for _, date, _ in payments],
+        'Amount': [amount for _, _, amount in payments],
+        'Bank': ['Kotak'] * len(payments),
+        'ACCHead': ['Salary Exp-Payable'] * len(payments)
+    }
+
+
+def test_match_amounts_and_variance_buckets():
+    reconciler = EnhancedReconciliation(use_cache=False, tolerance_amount=1.0)
+    salary_keys = pd.Series([1, 2, 3, 4, 5, 6])
+    expected = [10000] * 6
+    paid_per_employee = pd.Series({1: 10000, 2: 10050, 3: 9000, 4: 250000, 6: 20000})
+
+    status, paid, variance = reconciler.match_amounts(salary_keys, expected, paid_per_employee)
+    assert list(status.cat.categories) == AMOUNT_STATUSES
+    assert status.tolist() == ['Exact', 'Within Tolerance', 'Short Paid', 'Over Paid', 'Missing', 'Over Paid']
+    assert paid.tolist() == [10000, 10050, 9000, 250000, 0, 20000]
+    assert variance.tolist() == [0, 50, -1000, 240000, 0, 10000]
+
+    buckets = reconciler.variance_buckets(status, variance)
+    assert buckets.tolist() == ['Exact', 'Within Tolerance', 'Up to ₹100', '₹1,000 - ₹10,000', 'Missing',
+                                'Up to ₹100']
+
+
+@pytest.mark.skipif(not PARQUET_AVAILABLE, reason="the carry-forward ledger needs pyarrow")
+def test_carry_forward_across_two_periods(tmp_path, write_source):
+    salary = write_source('salary.csv', EMPLOYEES)
+    june_soa = write_source('kotak_june.csv', bank_soa([
+        ('Asha Rao-101', '05-Jul-2025', 50000),
+        ('Vikram Singh-102', '05-Jul-2025', 39000),
+        # Dated in the July salary window: parked for that run
+        ('Neha Gupta-103', '05-Aug-2025', 30000)
+    ]))
+    july_soa = write_source('kotak_july.csv', bank_soa([
+        ('Asha Rao-101', '05-Aug-2025', 50000),
+        ('Vikram Singh-102', '05-Aug-2025', 41000),
+        ('Rahul Jain-104', '05-Aug-2025', 40000)
+    ]))
+
+    def reconcile(period, soa):
+        reconciler = EnhancedReconciliation(use_cache=False, state_dir=str(tmp_path / 'state'))
+        salary_df, _, _ = reconciler.reconcile_six_files({'salary': salary, 'bank_kotak': soa}, period=period)
+        return reconciler, salary_df.set_index('EmpCode')
+
+    _, june = reconcile('2025-06', june_soa)
+    assert june['Bank_Amount_Status'].tolist() == ['Exact', 'Short Paid', 'Missing', 'Missing']
+
+    # The same salary sheet for July: its run must not reuse June's results
+    reconciler, july = reconcile('2025-07', july_soa)
+    assert july['Bank_Match_Window'].tolist() == ['Current', 'Carried Forward', 'Adjacent Window', 'Carried Forward']
+    assert july['Bank_Amount_Status'].tolist() == ['Exact'] * 4
+
+    ledger = reconciler.carry_forward.frame
+    june_items = ledger[(ledger['Kind'] == 'Open Item') & (ledger['Period'] == '2025-06')].set_index('Employee_Key')
+    assert june_items['Amount'].to_dict() == {102: 100000, 103: 3000000, 104: 2000000}
+    # 103's payment only covers July, so June's salary is still owed
+    assert june_items['Resolved_In'].fillna('').to_dict() == {102: '2025-07', 103: '', 104: '2025-07'}
+
+    # Re-running July settles the same items again instead of double counting
+    reconciler, rerun = reconcile('2025-07', july_soa)
+    assert rerun['Bank_Match_Window'].tolist() == july['Bank_Match_Window'].tolist()
+    pd.testing.assert_frame_equal(reconciler.carry_forward.frame.sort_values(['Kind', 'Period', 'Employee_Key'])
+                                  .reset_index(drop=True),
+                                  ledger.sort_values(['Kind', 'Period', 'Employee_Key']).reset_index(drop=True))
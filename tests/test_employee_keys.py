@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from salary_reconciliation_agent import (MISSING_KEY, EmployeeIdentityIndex, canonical_employee_keys,
+                                         normalize_identifiers)
+
+
+def test_canonical_keys_from_text():
+    values = pd.Series(['3220', '3220.0', '003220', 'Rukhsar Khureshi-3220', ' 42 ', None, '', 'ABC'], dtype=object)
+    keys, unparsed = canonical_employee_keys(values)
+    assert keys.dtype == 'int64'
+    assert keys.tolist() == [3220, 3220, 3220, 3220, 42, MISSING_KEY, MISSING_KEY, MISSING_KEY]
+    # Only non-blank values without an employee number are reported
+    assert unparsed.tolist() == [False] * 7 + [True]
+
+
+def test_canonical_keys_from_numbers():
+    keys, unparsed = canonical_employee_keys(pd.Series([3220.0, None, 17.0]))
+    assert keys.tolist() == [3220, MISSING_KEY, 17]
+    assert not unparsed.any()
+
+    keys, _ = canonical_employee_keys(pd.Series([5, 6]))
+    assert keys.dtype == 'int64' and keys.tolist() == [5, 6]
+
+
+def test_normalize_identifiers():
+    assert normalize_identifiers(pd.Series([100200300400.0]), 'uan').tolist() == ['100200300400']
+    assert normalize_identifiers(['1002 0030 0400'], 'uan').tolist() == ['100200300400']
+    assert normalize_identifiers([' abcde1234f '], 'pan').tolist() == ['ABCDE1234F']
+
+
+def test_normalize_identifiers_drops_placeholders():
+    uan = normalize_identifiers(['NA', 'N/A', '0', '123'], 'uan')
+    assert uan.isna().all()
+    assert normalize_identifiers(['PANNOTAVBL', 'NA'], 'pan').isna().all()
+    assert normalize_identifiers(['1234'], 'bank_account').isna().all()
+
+
+def test_identity_index_ignores_placeholders(tmp_path):
+    index = EmployeeIdentityIndex(str(tmp_path / 'identity.db'))
+    index.update([101, 102, 103], {'uan': ['100200300400', 'NA', 'N/A']})
+
+    assert index.resolve('uan', ['NA', 'n/a']).tolist() == [MISSING_KEY, MISSING_KEY]
+    assert index.resolve('uan', ['100200300400']).tolist() == [101]
+
+
+def test_identity_index_drops_shared_identifiers(tmp_path):
+    index = EmployeeIdentityIndex(str(tmp_path / 'identity.db'))
+    index.update([101], {'pan': ['ABCDE1234F']})
+    assert index.resolve('pan', ['abcde1234f']).tolist() == [101]
+
+    # A later sheet gives the PAN to two employees: it no longer identifies anyone
+    written, _ = index.update([101, 102], {'pan': ['ABCDE1234F', 'ABCDE1234F']})
+    assert written == 0
+    assert index.resolve('pan', ['ABCDE1234F']).tolist() == [MISSING_KEY]
+
+
+def test_identity_index_moves_reassigned_identifiers(tmp_path):
+    index = EmployeeIdentityIndex(str(tmp_path / 'identity.db'))
+    index.update([101], {'bank_account': ['53910003119']})
+    written, moved = index.update([105], {'bank_account': ['053910003119']})
+
+    assert (written, moved) == (1, 1)
+    keys = index.resolve('bank_account', ['53910003119', '99999999999'])
+    assert np.array_equal(keys, [105, MISSING_KEY])
@@ -0,0 +1,97 @@
+import pandas as pd
+import pytest
+
+from salary_reconciliation_agent import PARQUET_AVAILABLE, STATUS_CODE_COLUMN, EnhancedReconciliation
+
+pytestmark = pytest.mark.skipif(not PARQUET_AVAILABLE, reason="saved run state needs pyarrow")
+
+EMPLOYEES = [101, 102, 103, 104, 105]
+COMPARED_COLUMNS = ['EmpCode', STATUS_CODE_COLUMN, 'Bank_Payment_Count', 'Bank_Amount_Status', 'Bank_Variance',
+                    'Bank_Match_Window', 'TDS_Amount_Status', 'TDS_Variance']
+
+
+@pytest.fixture
+def files(write_source):
+    return {
+        'salary': write_source('salary.csv', {
+            'EmpCode': EMPLOYEES,
+            'EmployeeName': ['Asha Rao', 'Vikram Singh', 'Neha Gupta', 'Rahul Jain', 'Meera Iyer'],
+            'Designation': ['Executive'] * 5,
+            'BaseLocation': ['Delhi', 'Gurgaon', 'Delhi', 'Bangalore', 'Delhi'],
+            'Basic': [20000] * 5,
+            'TDS': [1000, 0, 500, 0, 2000],
+            'ClubNetpayable': [50000, 40000, 30000, 20000, 60000],
+            'UAN': ['100200300401', '100200300402', '100200300403', 'NA', '100200300405']
+        }),
+        'bank_kotak': write_source('kotak.csv', {
+            'TransactionID': [1, 2, 3, 4],
+            'GroupId': [0] * 4,
+            'Employee': ['Asha Rao-101', 'Vikram Singh-102', 'Neha Gupta-103', 'Meera Iyer-105'],
+            'Type': ['Payment'] * 4,
+            'Date': ['05-Jul-2025'] * 4,
+            'Amount': [50000, 39000, 30000, 60000],
+            'Bank': ['Kotak'] * 4,
+            'ACCHead': ['Salary Exp-Payable'] * 4
+        }),
+        'tds': write_source('tds.csv', {'Employee Code': [101, 103, 105], 'Salary TDS': [1000, 400, 2000]}),
+        'epf': write_source('epf.csv', {'Employee Code': [101, 102, 103], 'EPF Contribution': [1800] * 3})
+    }
+
+
+def reconcile(files, state_dir):
+    reconciler = EnhancedReconciliation(use_cache=False, state_dir=str(state_dir))
+    salary_df, discrepancies, matches = reconciler.reconcile_six_files(files, period='2025-06')
+    return reconciler, salary_df, discrepancies, matches
+
+
+def assert_same_results(incremental, full):
+    inc_reconciler, inc_df, inc_discrepancies, inc_matches = incremental
+    full_reconciler, full_df, full_discrepancies, full_matches = full
+    assert inc_matches == full_matches
+    columns = [col for col in COMPARED_COLUMNS if col in full_df.columns]
+    pd.testing.assert_frame_equal(inc_df[columns].reset_index(drop=True), full_df[columns].reset_index(drop=True),
+                                  check_dtype=False, check_categorical=False)
+    pd.testing.assert_frame_equal(inc_discrepancies.reset_index(drop=True), full_discrepancies.reset_index(drop=True),
+                                  check_dtype=False, check_categorical=False)
+    pd.testing.assert_frame_equal(inc_reconciler.match_matrix.reset_index(drop=True),
+                                  full_reconciler.match_matrix.reset_index(drop=True))
+
+
+def test_unchanged_inputs_reuse_the_last_run(tmp_path, files, capsys):
+    first = reconcile(files, tmp_path / 'state')
+    capsys.readouterr()
+    again = reconcile(files, tmp_path / 'state')
+
+    assert "No source changed since the last run" in capsys.readouterr().out
+    assert_same_results(again, first)
+
+
+@pytest.mark.parametrize('changed, columns', [
+    ('epf', {'Employee Code': [101, 104], 'EPF Contribution': [1800, 1800]}),
+    ('bank_kotak', {
+        'TransactionID': [7, 8],
+        'GroupId': [0, 0],
+        'Employee': ['Vikram Singh-102', 'Rahul Jain-104'],
+        'Type': ['Payment'] * 2,
+        'Date': ['06-Jul-2025'] * 2,
+        'Amount': [40000, 20000],
+        'Bank': ['Kotak'] * 2,
+        'ACCHead': ['Salary Exp-Payable'] * 2
+    })
+])
+def test_changed_source_matches_a_full_run(tmp_path, files, write_source, capsys, changed, columns):
+    reconcile(files, tmp_path / 'state')
+    changed_files = dict(files, **{changed: write_source(f'{changed}_changed.csv', columns)})
+    capsys.readouterr()
+
+    incremental = reconcile(changed_files, tmp_path / 'state')
+    assert f"re-matching {changed}" in capsys.readouterr().out
+    full = reconcile(changed_files, tmp_path / 'fresh')
+    assert_same_results(incremental, full)
+
+
+def test_removed_source_matches_a_full_run(tmp_path, files):
+    reconcile(files, tmp_path / 'state')
+    remaining = {file_type: path for file_type, path in files.items() if file_type != 'tds'}
+
+    assert_same_results(reconcile(remaining, tmp_path / 'state'), reconcile(remaining, tmp_path / 'fresh'))